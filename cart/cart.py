@@ -1,4 +1,47 @@
-from store.models import Product, Profile
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+
+from store.models import Product
+from .models import CartLine
+
+# Una línea del carrito con el precio efectivo ya resuelto
+CartEntry = namedtuple('CartEntry', ['product', 'quantity', 'unit_price', 'subtotal'])
+
+
+class CartSnapshot:
+	"""
+	Foto del carrito: carga los productos una vez (con el precio efectivo
+	anotado) y calcula subtotales, total y cantidad de unidades en una pasada.
+	"""
+	def __init__(self, quantities):
+		product_ids = [int(product_id) for product_id in quantities]
+		products = Product.objects.filter(id__in=product_ids).with_effective_price() if product_ids else []
+		self.lines = []
+		self.total = Decimal('0')
+		self.count = 0
+		for product in products:
+			quantity = quantities[str(product.id)]
+			subtotal = product.effective_price * quantity
+			self.lines.append(CartEntry(product, quantity, product.effective_price, subtotal))
+			self.total += subtotal
+			self.count += quantity
+
+	@property
+	def products(self):
+		return [line.product for line in self.lines]
+
+
+def get_cart(request):
+	"""
+	El Cart del request: context processor, vistas y templates comparten la
+	misma foto, y CartPersistenceMiddleware guarda sus cambios al final.
+	"""
+	if not hasattr(request, '_cart'):
+		request._cart = Cart(request)
+	return request._cart
+
 
 class Cart():
 	def __init__(self, request):
@@ -15,75 +58,75 @@ class Cart():
 
 		# Make sure cart is available on all pages of site
 		self.cart = cart
-
-	def db_add(self, product, quantity):
-		product_id = str(product)
-		product_qty = str(quantity)
-		# Logic
-		if product_id in self.cart:
-			pass
-		else:
-			#self.cart[product_id] = {'price': str(product.price)}
-			self.cart[product_id] = int(product_qty)
-
-		self.session.modified = True
-
-		# Deal with logged in user
+		self._snapshot = None
+		# Cambios a guardar en CartLine al final del request: {product_id: cantidad o None (borrar)}
+		self._pending = {}
+
+	def snapshot(self):
+		# Se calcula una vez por request y se descarta cuando el carrito cambia
+		if self._snapshot is None:
+			self._snapshot = CartSnapshot(self.cart)
+		return self._snapshot
+
+	def _mark(self, product_id, quantity):
+		# Solo se anota: flush() escribe una vez por request (ver cart.middleware)
 		if self.request.user.is_authenticated:
-			# Get the current user profile
-			current_user = Profile.objects.filter(user__id=self.request.user.id)
-			# Convert {'3':1, '2':4} to {"3":1, "2":4}
-			carty = str(self.cart)
-			carty = carty.replace("\'", "\"")
-			# Save carty to the Profile Model
-			current_user.update(old_cart=str(carty))
-
+			self._pending[str(product_id)] = quantity
+
+	def flush(self):
+		"""Guarda los cambios pendientes: como mucho una lectura, un upsert y un delete, o nada"""
+		if not self._pending or not self.request.user.is_authenticated:
+			self._pending = {}
+			return
+		user = self.request.user
+		changed = [(int(product_id), quantity) for product_id, quantity in self._pending.items() if quantity is not None]
+		removed = [int(product_id) for product_id, quantity in self._pending.items() if quantity is None]
+		self._pending = {}
+		if changed:
+			# Ids de productos borrados (o inventados) no pueden ir a CartLine: la FK fallaría
+			existing = set(Product.objects.filter(id__in=[product_id for product_id, quantity in changed]).values_list('id', flat=True))
+			changed = [(product_id, quantity) for product_id, quantity in changed if product_id in existing]
+		# El carrito guardado queda con todos los cambios del request o con ninguno
+		with transaction.atomic():
+			if changed:
+				# Upsert de las líneas cambiadas, sin reescribir el resto del carrito
+				CartLine.objects.bulk_create(
+					[CartLine(user=user, product_id=product_id, quantity=quantity) for product_id, quantity in changed],
+					update_conflicts=True,
+					unique_fields=['user', 'product'],
+					update_fields=['quantity', 'updated_at'],
+				)
+			if removed:
+				CartLine.objects.filter(user=user, product_id__in=removed).delete()
+
+	def restore_saved(self):
+		"""Al iniciar sesión: suma el carrito guardado (una lectura) y guarda lo agregado como anónimo"""
+		saved = dict(CartLine.objects.filter(user=self.request.user).values_list('product_id', 'quantity'))
+		for product_id, quantity in saved.items():
+			self.cart.setdefault(str(product_id), quantity)
+		self.session.modified = True
+		self._snapshot = None
+		for product_id, quantity in self.cart.items():
+			if int(product_id) not in saved:
+				self._mark(product_id, quantity)
 
 	def add(self, product, quantity):
 		product_id = str(product.id)
 		product_qty = str(quantity)
 		# Logic
 		if product_id in self.cart:
-			pass
-		else:
-			#self.cart[product_id] = {'price': str(product.price)}
-			self.cart[product_id] = int(product_qty)
+			return
+		#self.cart[product_id] = {'price': str(product.price)}
+		self.cart[product_id] = int(product_qty)
 
 		self.session.modified = True
+		self._snapshot = None
 
 		# Deal with logged in user
-		if self.request.user.is_authenticated:
-			# Get the current user profile
-			current_user = Profile.objects.filter(user__id=self.request.user.id)
-			# Convert {'3':1, '2':4} to {"3":1, "2":4}
-			carty = str(self.cart)
-			carty = carty.replace("\'", "\"")
-			# Save carty to the Profile Model
-			current_user.update(old_cart=str(carty))
+		self._mark(product_id, self.cart[product_id])
 
 	def cart_total(self):
-		# Get product IDS
-		product_ids = self.cart.keys()
-		# lookup those keys in our products database model
-		products = Product.objects.filter(id__in=product_ids)
-		# Get quantities
-		quantities = self.cart
-		# Start counting at 0
-		total = 0
-		
-		for key, value in quantities.items():
-			# Convert key string into into so we can do math
-			key = int(key)
-			for product in products:
-				if product.id == key:
-					if product.is_sale:
-						total = total + (product.sale_price * value)
-					else:
-						total = total + (product.price * value)
-
-
-
-		return total
+		return self.snapshot().total
 
 
 
@@ -91,13 +134,8 @@ class Cart():
 		return len(self.cart)
 
 	def get_prods(self):
-		# Get ids from cart
-		product_ids = self.cart.keys()
-		# Use ids to lookup products in database model
-		products = Product.objects.filter(id__in=product_ids)
-
-		# Return those looked up products
-		return products
+		# Productos del carrito (con el precio efectivo anotado), de la foto del request
+		return self.snapshot().products
 
 	def get_quants(self):
 		quantities = self.cart
@@ -109,40 +147,37 @@ class Cart():
 
 		# Get cart
 		ourcart = self.cart
+		# Sin cambios no hay nada que guardar
+		if ourcart.get(product_id) == product_qty:
+			return ourcart
 		# Update Dictionary/cart
 		ourcart[product_id] = product_qty
 
 		self.session.modified = True
-	
+		self._snapshot = None
 
 		# Deal with logged in user
-		if self.request.user.is_authenticated:
-			# Get the current user profile
-			current_user = Profile.objects.filter(user__id=self.request.user.id)
-			# Convert {'3':1, '2':4} to {"3":1, "2":4}
-			carty = str(self.cart)
-			carty = carty.replace("\'", "\"")
-			# Save carty to the Profile Model
-			current_user.update(old_cart=str(carty))
-
+		self._mark(product_id, product_qty)
 
 		thing = self.cart
 		return thing
 
 	def delete(self, product):
 		product_id = str(product)
+		# Si no estaba en el carrito no hay nada que guardar
+		if product_id not in self.cart:
+			return
 		# Delete from dictionary/cart
-		if product_id in self.cart:
-			del self.cart[product_id]
+		del self.cart[product_id]
 
 		self.session.modified = True
+		self._snapshot = None
 
 		# Deal with logged in user
-		if self.request.user.is_authenticated:
-			# Get the current user profile
-			current_user = Profile.objects.filter(user__id=self.request.user.id)
-			# Convert {'3':1, '2':4} to {"3":1, "2":4}
-			carty = str(self.cart)
-			carty = carty.replace("\'", "\"")
-			# Save carty to the Profile Model
-			current_user.update(old_cart=str(carty))
\ No newline at end of file
+		self._mark(product_id, None)
+
+
+def forget_saved_cart(user):
+	"""Borra el carrito guardado de un usuario (después de comprar o reservar)"""
+	if user.is_authenticated:
+		CartLine.objects.filter(user=user).delete()
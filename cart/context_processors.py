@@ -1,6 +1,9 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
 
 # Create context processor so our cart can work on all pages of the site
 def cart(request):
 	# Return the default data from our Cart
-	return {'cart': Cart(request)}
\ No newline at end of file
+	# Lazy: las páginas que no muestran el carrito no tocan la sesión.
+	# Es el mismo Cart que usan las vistas del request (get_cart)
+	return {'cart': SimpleLazyObject(lambda: get_cart(request))}
\ No newline at end of file
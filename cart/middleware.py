@@ -0,0 +1,21 @@
+"""
+Guarda el carrito de los usuarios registrados una sola vez por request
+"""
+
+
+class CartPersistenceMiddleware:
+    """
+    Las mutaciones del Cart solo anotan las líneas cambiadas; acá se escriben
+    juntas al terminar el request (o no se escribe nada si no hubo cambios).
+    Como SessionMiddleware, no guarda si la respuesta es un error 500.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, '_cart', None)
+        if cart is not None and response.status_code < 500:
+            cart.flush()
+        return response
@@ -0,0 +1,53 @@
+import json
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_saved_carts(apps, schema_editor):
+    Profile = apps.get_model('store', 'Profile')
+    Product = apps.get_model('store', 'Product')
+    CartLine = apps.get_model('cart', 'CartLine')
+    db_alias = schema_editor.connection.alias
+    existing = set(Product.objects.using(db_alias).values_list('id', flat=True))
+    lines = []
+    for user_id, old_cart in Profile.objects.using(db_alias).exclude(old_cart__isnull=True).exclude(old_cart='').values_list('user_id', 'old_cart'):
+        try:
+            saved = json.loads(old_cart)
+        except ValueError:
+            # Carritos truncados por el límite de 200 caracteres: no se pueden recuperar
+            continue
+        for product_id, quantity in saved.items():
+            if str(product_id).isdigit() and int(product_id) in existing:
+                lines.append(CartLine(user_id=user_id, product_id=int(product_id), quantity=int(quantity)))
+    CartLine.objects.using(db_alias).bulk_create(lines)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('store', '0024_product_cooccurrence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Línea de Carrito',
+                'verbose_name_plural': 'Líneas de Carrito',
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_line')],
+            },
+        ),
+        migrations.RunPython(copy_saved_carts, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,23 @@
 from django.db import models
+from django.contrib.auth.models import User
+from store.models import Product
 
-# Create your models here.
+
+# Carrito guardado de los usuarios registrados: una fila por producto, así
+# cada cambio escribe solo su línea y no hay límite de tamaño (reemplaza a Profile.old_cart)
+class CartLine(models.Model):
+	user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_lines')
+	product = models.ForeignKey(Product, on_delete=models.CASCADE)
+	quantity = models.PositiveIntegerField(default=1)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.user} - {self.product_id} x {self.quantity}"
+
+	class Meta:
+		constraints = [
+			# También es el índice de la lectura al iniciar sesión (user = ?)
+			models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_line'),
+		]
+		verbose_name = "Línea de Carrito"
+		verbose_name_plural = "Líneas de Carrito"
@@ -1,3 +1,210 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.models import Category, Product
+from store.testing import StoreTestCase
+from .cart import Cart, get_cart
+from .models import CartLine
+
+
+class CartSnapshotTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Municiones')
+        self.caja = Product.objects.create(name='Caja 9mm', price=1000, stock=10, category=category)
+        self.oferta = Product.objects.create(name='Caja .22', price=800, is_sale=True, sale_price=500, stock=10, category=category)
+        for product, qty in ((self.caja, 2), (self.oferta, 3)):
+            self.client.post(reverse('cart_add'), {'action': 'post', 'product_id': product.id, 'product_qty': qty})
+
+    def test_cart_page_loads_products_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart_summary'))
+        self.assertEqual(len([q for q in queries if 'store_product' in q['sql']]), 1)
+        self.assertEqual(response.context['totals'], 3500)
+        self.assertContains(response, '<option value="3" selected>')
+
+    def test_snapshot_lines_and_invalidation(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = AnonymousUser()
+        cart = get_cart(request)
+        self.assertIs(get_cart(request), cart)
+        snapshot = cart.snapshot()
+        self.assertEqual([(line.product, line.quantity, line.subtotal) for line in snapshot.lines],
+                         [(self.caja, 2, 2000), (self.oferta, 3, 1500)])
+        self.assertEqual(snapshot.count, 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.cart_total(), 3500)
+            cart.get_prods()
+        cart.delete(product=self.caja.id)
+        self.assertEqual(cart.cart_total(), 1500)
+
+
+class CartTotalScalingTest(StoreTestCase):
+    # Los tiempos se miden con python manage.py bench_cart_total; acá solo la
+    # cantidad de consultas y el total, que no dependen de la carga de la máquina
+    def test_total_is_one_query_for_large_carts(self):
+        category = Category.objects.create(name='Mayorista')
+        Product.objects.bulk_create([
+            Product(name=f'Insumo {i}', price=100 + i, is_sale=i % 2 == 0, sale_price=50, category=category)
+            for i in range(500)
+        ])
+        ids = list(Product.objects.values_list('id', flat=True))
+        for size in (1, 50, 500):
+            request = RequestFactory().get('/')
+            request.session = {'session_key': {str(pk): 2 for pk in ids[:size]}}
+            request.user = AnonymousUser()
+            cart = Cart(request)
+            with self.assertNumQueries(1):
+                total = cart.cart_total()
+            expected = sum((50 if i % 2 == 0 else 100 + i) * 2 for i in range(size))
+            self.assertEqual(total, expected)
+
+
+class SavedCartTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Cuchillos')
+        self.products = [Product.objects.create(name=f'Cuchillo {i}', price=100, stock=10, category=category) for i in range(3)]
+        self.user = User.objects.create_user('cliente', 'cliente@example.com', 'clave-segura-123')
+
+    def add(self, product, qty=1):
+        self.client.post(reverse('cart_add'), {'action': 'post', 'product_id': product.id, 'product_qty': qty})
+
+    def test_login_merges_saved_lines_in_one_read(self):
+        CartLine.objects.create(user=self.user, product=self.products[0], quantity=2)
+        self.add(self.products[1], 3)
+        self.client.post(reverse('login'), {'email': 'cliente@example.com', 'password': 'clave-segura-123'})
+        self.assertEqual(self.client.session['session_key'], {str(self.products[1].id): 3, str(self.products[0].id): 2})
+        saved = dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.products[0].id: 2, self.products[1].id: 3})
+
+    def test_each_mutation_writes_only_its_line(self):
+        self.client.force_login(self.user)
+        for product in self.products:
+            self.add(product)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('cart_update'), {'action': 'post', 'product_id': self.products[1].id, 'product_qty': 4})
+        writes = [q for q in queries if 'cart_cartline' in q['sql']]
+        self.assertEqual(len(writes), 1)
+        self.client.post(reverse('cart_delete'), {'action': 'post', 'product_id': self.products[0].id})
+        saved = dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.products[1].id: 4, self.products[2].id: 1})
+
+    def test_unknown_or_deleted_products_never_reach_saved_lines(self):
+        self.add(self.products[0])
+        self.add(self.products[1])
+        self.products[1].delete()
+        # El carrito de la sesión todavía tiene el producto borrado al iniciar sesión
+        self.client.post(reverse('login'), {'email': 'cliente@example.com', 'password': 'clave-segura-123'})
+        saved = dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.products[0].id: 1})
+        response = self.client.post(reverse('cart_update'), {'action': 'post', 'product_id': 9999, 'product_qty': 2})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartLine.objects.filter(product_id=9999).exists())
+
+
+class DeferredCartPersistenceTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Fundas')
+        self.products = [Product.objects.create(name=f'Funda {i}', price=100, stock=10, category=category) for i in range(4)]
+        self.user = User.objects.create_user('cliente', 'cliente@example.com', 'clave-segura-123')
+
+    def test_many_mutations_flush_once(self):
+        CartLine.objects.create(user=self.user, product=self.products[3], quantity=1)
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = self.user
+        cart = get_cart(request)
+        cart.restore_saved()
+        with CaptureQueriesContext(connection) as queries:
+            for product in self.products[:3]:
+                cart.add(product=product, quantity=1)
+            cart.update(product=self.products[0].id, quantity=5)
+            cart.delete(product=self.products[3].id)
+        self.assertFalse([q for q in queries if 'cart_cartline' in q['sql']])
+        # Productos existentes, upsert y delete (más el savepoint del atomic)
+        with CaptureQueriesContext(connection) as queries:
+            cart.flush()
+        self.assertEqual(len([q for q in queries if 'SAVEPOINT' not in q['sql']]), 3)
+        with self.assertNumQueries(0):
+            cart.flush()
+        saved = dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.products[0].id: 5, self.products[1].id: 1, self.products[2].id: 1})
+
+    def test_flush_is_all_or_nothing(self):
+        CartLine.objects.create(user=self.user, product=self.products[3], quantity=1)
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = self.user
+        cart = get_cart(request)
+        cart.restore_saved()
+        cart.add(product=self.products[0], quantity=1)
+        cart.delete(product=self.products[3].id)
+        with mock.patch.object(QuerySet, 'delete', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            cart.flush()
+        saved = dict(CartLine.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(saved, {self.products[3].id: 1})
+
+    def test_deleting_a_product_not_in_the_cart_writes_nothing(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = self.user
+        cart = get_cart(request)
+        cart.delete(product=self.products[0].id)
+        with self.assertNumQueries(0):
+            cart.flush()
+
+    def test_unchanged_update_skips_the_write(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('cart_add'), {'action': 'post', 'product_id': self.products[0].id, 'product_qty': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('cart_update'), {'action': 'post', 'product_id': self.products[0].id, 'product_qty': 2})
+        self.assertFalse([q for q in queries if 'cart_cartline' in q['sql']])
+
+
+class CartBatchTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Cargadores')
+        self.products = [Product.objects.create(name=f'Cargador {i}', price=1000, stock=10, category=category) for i in range(3)]
+        self.products[2].is_sale = True
+        self.products[2].sale_price = 600
+        self.products[2].save()
+
+    def batch(self, operations):
+        return self.client.post(reverse('cart_batch'), json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_operations_apply_in_one_request(self):
+        a, b, c = self.products
+        self.batch([{'op': 'add', 'product_id': a.id, 'quantity': 1}, {'op': 'add', 'product_id': b.id}])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch([
+                {'op': 'update', 'product_id': a.id, 'quantity': 3},
+                {'op': 'remove', 'product_id': b.id},
+                {'op': 'add', 'product_id': c.id, 'quantity': 2},
+            ])
+        self.assertEqual(len([q for q in queries if 'store_product' in q['sql']]), 2)
+        data = response.json()
+        self.assertEqual(data['lines'], [
+            {'product_id': a.id, 'quantity': 3, 'unit_price': '1000.00', 'subtotal': '3000.00'},
+            {'product_id': c.id, 'quantity': 2, 'unit_price': '600.00', 'subtotal': '1200.00'},
+        ])
+        self.assertEqual((data['total'], data['count'], data['qty']), ('4200.00', 5, 2))
+
+    def test_invalid_batch_changes_nothing(self):
+        a = self.products[0]
+        self.batch([{'op': 'add', 'product_id': a.id, 'quantity': 1}])
+        response = self.batch([{'op': 'update', 'product_id': a.id, 'quantity': 4}, {'op': 'add', 'product_id': 9999}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_ids'], [9999])
+        self.assertEqual(self.batch([{'op': 'update', 'product_id': a.id, 'quantity': 0}]).status_code, 400)
+        self.assertEqual(self.client.session['session_key'], {str(a.id): 1})
@@ -6,6 +6,8 @@ urlpatterns = [
 	path('add/', views.cart_add, name="cart_add"),
 	path('delete/', views.cart_delete, name="cart_delete"),
 	path('update/', views.cart_update, name="cart_update"),
+	path('batch/', views.cart_batch, name="cart_batch"),
+	path('badge/', views.cart_badge, name="cart_badge"),
    # path("pago_exitoso", views.pago_exitoso, name="pago_exitoso"),
     #path("pago_fallido", views.pago_fallido, name="pago_fallido"),
    # path("pago_pendiente", views.pago_pendiente, name="pago_pendiente"),
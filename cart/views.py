@@ -1,24 +1,34 @@
 from django.shortcuts import render, get_object_or_404
-from .cart import Cart
+from .cart import get_cart
 from store.models import Product
 from django.http import JsonResponse
 from django.contrib import messages
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_POST
+import json
+
+BATCH_OPERATIONS = ('add', 'update', 'remove')
+MAX_BATCH_OPERATIONS = 500
 
 
 def cart_summary(request):
 	# Get the cart
-	cart = Cart(request)
-	cart_products = cart.get_prods()
-	quantities = cart.get_quants()
+	cart = get_cart(request)
 	totals = cart.cart_total()
-	return render(request, "cart_summary.html", {"cart_products":cart_products, "quantities":quantities, "totals":totals})
+	# Cada línea trae su producto y cantidad: el template no cruza productos con cantidades
+	cart_lines = cart.snapshot().lines
+	return render(request, "cart_summary.html", {"cart_lines":cart_lines, "totals":totals})
 
 
+@never_cache
+def cart_badge(request):
+	# Contador del carrito para las páginas servidas desde el cache de anónimos
+	return JsonResponse({'qty': len(get_cart(request))})
 
 
 def cart_add(request):
 	# Get the cart
-	cart = Cart(request)
+	cart = get_cart(request)
 	# test for POST
 	if request.POST.get('action') == 'post':
 		# Get stuff
@@ -41,7 +51,7 @@ def cart_add(request):
 		return response
 
 def cart_delete(request):
-	cart = Cart(request)
+	cart = get_cart(request)
 	if request.POST.get('action') == 'post':
 		# Get stuff
 		product_id = int(request.POST.get('product_id'))
@@ -54,14 +64,72 @@ def cart_delete(request):
 		return response
 
 
+def _parse_operation(operation):
+	kind = operation['op']
+	if kind not in BATCH_OPERATIONS:
+		raise ValueError(kind)
+	product_id = int(operation['product_id'])
+	quantity = None
+	if kind != 'remove':
+		quantity = int(operation.get('quantity', 1))
+		if quantity < 1:
+			raise ValueError(quantity)
+	return kind, product_id, quantity
+
+
+@require_POST
+def cart_batch(request):
+	"""
+	Varias operaciones sobre el carrito en un solo request (JSON):
+	{"operations": [{"op": "add" | "update" | "remove", "product_id": 3, "quantity": 2}, ...]}
+	Se valida todo (los productos, en una consulta) antes de aplicar: o se
+	aplican todas o ninguna. Responde las líneas, el total y la cantidad.
+	"""
+	try:
+		operations = json.loads(request.body)['operations']
+		if not isinstance(operations, list) or len(operations) > MAX_BATCH_OPERATIONS:
+			raise ValueError('operations')
+		parsed = [_parse_operation(operation) for operation in operations]
+	except (ValueError, KeyError, TypeError):
+		return JsonResponse({'error': 'Operaciones inválidas'}, status=400)
+
+	product_ids = {product_id for kind, product_id, quantity in parsed if kind != 'remove'}
+	existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+	missing = sorted(product_ids - existing)
+	if missing:
+		return JsonResponse({'error': 'Productos inexistentes', 'product_ids': missing}, status=400)
+
+	cart = get_cart(request)
+	for kind, product_id, quantity in parsed:
+		if kind == 'remove':
+			cart.delete(product=product_id)
+		elif kind == 'update' or str(product_id) not in cart.cart:
+			# add no pisa la cantidad de un producto que ya está en el carrito (como cart_add)
+			cart.update(product=product_id, quantity=quantity)
+
+	snapshot = cart.snapshot()
+	return JsonResponse({
+		'lines': [
+			{'product_id': line.product.id, 'quantity': line.quantity, 'unit_price': f'{line.unit_price:.2f}', 'subtotal': f'{line.subtotal:.2f}'}
+			for line in snapshot.lines
+		],
+		'total': f'{snapshot.total:.2f}',
+		'count': snapshot.count,
+		'qty': len(cart),
+	})
+
+
 def cart_update(request):
-	cart = Cart(request)
+	cart = get_cart(request)
 	if request.POST.get('action') == 'post':
 		# Get stuff
 		product_id = int(request.POST.get('product_id'))
 		product_qty = int(request.POST.get('product_qty'))
 
-		cart.update(product=product_id, quantity=product_qty)
+		# lookup product in DB (como cart_add): un id que no existe no llega al carrito guardado
+		product = get_object_or_404(Product, id=product_id)
+
+		cart.update(product=product.id, quantity=product_qty)
 
 		response = JsonResponse({'qty':product_qty})
 		#return redirect('cart_summary')
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cart.middleware.CartPersistenceMiddleware',  # Guarda el carrito una vez por request
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'store.middleware.VisitCounterMiddleware',  # Nuestro middleware de contador de visitas
@@ -92,6 +93,39 @@ DATABASES = {
 }
 
 
+# Cache compartido por todos los procesos y hosts (workers de gunicorn y comandos
+# como process_image_tasks o build_recommendations): la versión del catálogo y
+# las páginas cacheadas tienen que ser las mismas en todos. Con LocMemCache cada
+# worker tendría su propia versión y no vería los cambios hechos por otro.
+# En producción se usa Redis (REDIS_URL) o Memcached (MEMCACHED_LOCATION), que
+# resuelven get_many/set_many en un solo viaje; sin ninguno de los dos queda la
+# tabla de la base (python manage.py createcachetable), también compartida.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'].split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
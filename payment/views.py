@@ -1,10 +1,10 @@
 from django.shortcuts import render, redirect
-from cart.cart import Cart
+from cart.cart import get_cart, forget_saved_cart
 from payment.forms import ShippingForm, PaymentForm, ShippingMethodForm
 from payment.models import ShippingAddress, Order, OrderItem
 from django.contrib.auth.models import User
 from django.contrib import messages
-from store.models import Product, Profile
+from store.models import Product
 import datetime
 import mercadopago
 from django.conf import settings
@@ -97,7 +97,7 @@ def shipped_dash(request):
 def process_order(request):
 	if request.POST:
 		# Get the cart
-		cart = Cart(request)
+		cart = get_cart(request)
 		cart_products = cart.get_prods()
 		quantities = cart.get_quants()
 		totals = cart.cart_total()
@@ -127,22 +127,11 @@ def process_order(request):
 			# Get the order ID
 			order_id = create_order.pk
 			
-			# Get product Info
-			for product in cart_products():
-				# Get product ID
-				product_id = product.id
-				# Get product price
-				if product.is_sale:
-					price = product.sale_price
-				else:
-					price = product.price
-
-				# Get quantity
-				for key,value in quantities().items():
-					if int(key) == product.id:
-						# Create order item
-						create_order_item = OrderItem(order_id=order_id, product_id=product_id, user=user, quantity=value, price=price)
-						create_order_item.save()
+			# Add order items: una línea por producto, con cantidad y precio efectivo ya resueltos
+			OrderItem.objects.bulk_create([
+				OrderItem(order_id=order_id, product_id=line.product.id, user=user, quantity=line.quantity, price=line.unit_price)
+				for line in cart.snapshot().lines
+			])
 
 			# Delete our cart
 			for key in list(request.session.keys()):
@@ -150,10 +139,8 @@ def process_order(request):
 					# Delete the key
 					del request.session[key]
 
-			# Delete Cart from Database (old_cart field)
-			current_user = Profile.objects.filter(user__id=request.user.id)
-			# Delete shopping cart in database (old_cart field)
-			current_user.update(old_cart="")
+			# Delete Cart from Database
+			forget_saved_cart(request.user)
 
 
 			messages.success(request, "Order Placed!")
@@ -172,22 +159,11 @@ def process_order(request):
 			# Get the order ID
 			order_id = create_order.pk
 			
-			# Get product Info
-			for product in cart_products():
-				# Get product ID
-				product_id = product.id
-				# Get product price
-				if product.is_sale:
-					price = product.sale_price
-				else:
-					price = product.price
-
-				# Get quantity
-				for key,value in quantities().items():
-					if int(key) == product.id:
-						# Create order item
-						create_order_item = OrderItem(order_id=order_id, product_id=product_id, quantity=value, price=price)
-						create_order_item.save()
+			# Add order items: una línea por producto, con cantidad y precio efectivo ya resueltos
+			OrderItem.objects.bulk_create([
+				OrderItem(order_id=order_id, product_id=line.product.id, quantity=line.quantity, price=line.unit_price)
+				for line in cart.snapshot().lines
+			])
 
 			# Delete our cart
 			for key in list(request.session.keys()):
@@ -207,7 +183,7 @@ def process_order(request):
 
 def billing_info(request):
     if request.POST:
-        cart = Cart(request)
+        cart = get_cart(request)
         cart_products = cart.get_prods()
         quantities = cart.get_quants()
         totals = cart.cart_total()
@@ -259,10 +235,7 @@ def billing_info(request):
                 quantity = quantities.get(str(product.id), 0)
                 
                 # Calcular precio
-                if product.is_sale:
-                    unit_price = product.sale_price
-                else:
-                    unit_price = product.price
+                unit_price = product.get_effective_price()
                 
                 total_price = unit_price * quantity
                 
@@ -309,10 +282,7 @@ def billing_info(request):
                     quantity = quantities.get(str(product.id), 0)
                     
                     # Calcular precio unitario
-                    if product.is_sale:
-                        unit_price = product.sale_price
-                    else:
-                        unit_price = product.price
+                    unit_price = product.get_effective_price()
                     
                     # Crear el OrderItem
                     OrderItem.objects.create(
@@ -328,12 +298,7 @@ def billing_info(request):
                 if key == "session_key":
                     del request.session[key]
             
-            if request.user.is_authenticated:
-                try:
-                    current_user = Profile.objects.filter(user__id=request.user.id)
-                    current_user.update(old_cart="")
-                except:
-                    pass
+            forget_saved_cart(request.user)
             
             # 🆕 ENVIAR EMAILS DE CONFIRMACIÓN
             if reservations_created:
@@ -385,9 +350,7 @@ def billing_info(request):
 
 def checkout(request):
 	# Get the cart
-	cart = Cart(request)
-	cart_products = cart.get_prods()
-	quantities = cart.get_quants()
+	cart = get_cart(request)
 	totals = cart.cart_total()
 	
 	# Formulario de método de envío
@@ -400,8 +363,7 @@ def checkout(request):
 		# Shipping Form
 		shipping_form = ShippingForm(request.POST or None, instance=shipping_user)
 		return render(request, "payment/checkout.html", {
-			"cart_products": cart_products, 
-			"quantities": quantities, 
+			"cart_lines": cart.snapshot().lines,
 			"totals": totals, 
 			"shipping_form": shipping_form,
 			"shipping_method_form": shipping_method_form
@@ -410,8 +372,7 @@ def checkout(request):
 		# Checkout as guest
 		shipping_form = ShippingForm(request.POST or None)
 		return render(request, "payment/checkout.html", {
-			"cart_products": cart_products, 
-			"quantities": quantities, 
+			"cart_lines": cart.snapshot().lines,
 			"totals": totals, 
 			"shipping_form": shipping_form,
 			"shipping_method_form": shipping_method_form
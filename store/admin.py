@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Customer, Product, Order, Profile, Reservation, ProductImage, VisitCounter, VisitSummary
+from .models import Category, Customer, Product, Order, Profile, Reservation, ProductImage, VisitCounter, VisitSummary, ImageTask
 from django.contrib.auth.models import User
 
 # Registro personalizado para Category con soporte de subcategorías
@@ -50,6 +50,13 @@ class ProductImageAdmin(admin.ModelAdmin):
     list_filter = ['is_primary', 'product']
     search_fields = ['product__name', 'alt_text']
 
+# Cola de procesamiento de imágenes
+@admin.register(ImageTask)
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'object_id', 'image_name', 'status', 'attempts', 'updated_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'object_id', 'image_name', 'attempts', 'last_error', 'created_at', 'updated_at']
+
 # Registro personalizado para Reservation
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
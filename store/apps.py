@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        # Registrar las señales que mantienen los índices de búsqueda y los caches
+        from . import search, autocomplete, catalog_cache, context_processors, images  # noqa: F401
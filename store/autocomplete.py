@@ -0,0 +1,117 @@
+"""
+Índice de prefijos en memoria para el autocompletado del buscador
+
+Los nombres normalizados de productos y categorías se guardan en un arreglo
+ordenado y se consultan con bisect, así cada tecla del navbar se responde
+sin ir a la base de datos. El índice se arma la primera vez que se usa y
+queda atado a la versión del catálogo (como las categorías del navbar), así
+un cambio hecho en cualquier proceso lo descarta en todos.
+"""
+import bisect
+import heapq
+import re
+import threading
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .catalog_cache import get_version
+from .models import Product, Category
+from .utils import normalize_text
+
+MAX_SUGGESTIONS = 8
+MIN_QUERY_LENGTH = 2
+# Largo máximo de cada clave; limita la memoria del índice
+KEY_LENGTH = 40
+
+# Las categorías se sugieren antes que los productos
+KIND_ORDER = {'category': 0, 'product': 1}
+
+
+class PrefixIndex:
+    """
+    Arreglo ordenado de claves normalizadas. Cada nombre se indexa desde el
+    inicio y desde cada palabra, para que "9mm" encuentre "Pistola 9mm".
+    """
+
+    def __init__(self, entries):
+        # entries: iterable de (nombre, tipo, url)
+        keyed = []
+        for position, (label, kind, url) in enumerate(entries):
+            normalized = normalize_text(label)
+            for word_index, match in enumerate(re.finditer(r'\w+', normalized)):
+                keyed.append((normalized[match.start():match.start() + KEY_LENGTH], word_index, position, label, kind, url))
+        keyed.sort()
+        self._keys = [item[0] for item in keyed]
+        self._items = keyed
+
+    def __len__(self):
+        return len(self._items)
+
+    def lookup(self, prefix, limit=MAX_SUGGESTIONS):
+        prefix = normalize_text(prefix)[:KEY_LENGTH]
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._keys, prefix)
+        # Todo el rango con el prefijo: cortarlo antes de ordenar dejaría afuera
+        # categorías que están más adelante en el arreglo
+        end = bisect.bisect_left(self._keys, prefix + '\uffff', start)
+        best = {}
+        for key, word_index, position, label, kind, url in self._items[start:end]:
+            # Primero categorías, luego coincidencias al inicio del nombre
+            rank = (KIND_ORDER[kind], word_index > 0, len(label))
+            if position not in best or rank < best[position][0]:
+                best[position] = (rank, label, kind, url)
+        matches = heapq.nsmallest(limit, best.values(), key=lambda match: match[0])
+        return [{'name': label, 'type': kind, 'url': url} for _, label, kind, url in matches]
+
+
+# Índice del proceso: (versión del catálogo, PrefixIndex)
+_index = None
+_lock = threading.Lock()
+
+
+def _build_index():
+    entries = []
+    for category in Category.objects.filter(is_active=True).select_related('parent'):
+        entries.append((category.name, 'category', category.get_absolute_url()))
+    for pk, name in Product.objects.values_list('id', 'name').iterator():
+        entries.append((name, 'product', reverse('product', args=[pk])))
+    return PrefixIndex(entries)
+
+
+def get_index():
+    """Devuelve el índice del proceso, armándolo si falta o cambió la versión del catálogo"""
+    global _index
+    version = get_version()
+    cached = _index
+    if cached is None or cached[0] != version:
+        with _lock:
+            cached = _index
+            if cached is None or cached[0] != version:
+                cached = (version, _build_index())
+                _index = cached
+    return cached[1]
+
+
+def invalidate():
+    global _index
+    # Con el lock, una reconstrucción en curso no deja un índice viejo
+    with _lock:
+        _index = None
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    """Sugerencias para el texto escrito hasta ahora"""
+    if len(normalize_text(query)) < MIN_QUERY_LENGTH:
+        return []
+    return get_index().lookup(query, limit)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_autocomplete(sender, **kwargs):
+    invalidate()
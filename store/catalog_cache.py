@@ -0,0 +1,65 @@
+"""
+Versión del catálogo para invalidar caches
+
+Cualquier cambio en productos, categorías o imágenes incrementa un número de
+versión guardado en el cache. Las claves que incluyen la versión quedan
+obsoletas al instante, sin tener que buscarlas y borrarlas una por una.
+
+El cache es compartido entre procesos (ver CACHES en settings), así un cambio
+hecho en un worker o en un comando de manage.py lo ven todos los demás.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category, ProductImage
+
+VERSION_KEY = 'catalog:version'
+
+
+def _initial_version():
+    # Si el cache pierde la clave, la nueva versión nunca repite una anterior
+    return int(time.time() * 1000)
+
+
+def get_version():
+    """Versión actual del catálogo"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        version = cache.get(VERSION_KEY, _initial_version())
+    return version
+
+
+def last_changed():
+    """
+    Momento aproximado del último cambio del catálogo: la versión es la hora
+    en milisegundos del último bump (ver bump_version)
+    """
+    return datetime.fromtimestamp(get_version() / 1000, tz=timezone.utc)
+
+
+def bump_version():
+    """Invalida todo lo cacheado con la versión anterior"""
+    # incr no es atómico entre procesos en el cache de archivos: usar la hora
+    # hace que dos workers que invalidan a la vez no repitan el mismo número
+    current = cache.get(VERSION_KEY) or 0
+    cache.set(VERSION_KEY, max(_initial_version(), current + 1), None)
+
+
+def make_key(*parts):
+    """Clave de cache atada a la versión actual del catálogo"""
+    return ':'.join(['catalog', str(get_version())] + [str(part) for part in parts])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def catalog_changed(sender, **kwargs):
+    bump_version()
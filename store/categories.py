@@ -0,0 +1,87 @@
+"""
+Árbol de categorías con conteo de productos para /api/categories/
+
+El árbol completo sale de dos consultas: las categorías (con su camino
+materializado) y un GROUP BY de productos por categoría. Los totales de
+cada nodo se acumulan en Python subiendo por el camino, y el JSON ya
+serializado queda en cache hasta el próximo cambio del catálogo.
+"""
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .catalog_cache import get_version, make_key
+from .models import Product, Category
+
+TREE_TIMEOUT = 60 * 60
+
+
+def build_tree():
+    """
+    Categorías activas anidadas, cada una con los productos de todo su subárbol.
+    Devuelve también la última modificación del catálogo, que sale de las
+    mismas dos consultas.
+    """
+    categories = list(Category.objects.order_by('id').values('id', 'name', 'parent_id', 'path', 'is_active', 'updated_at'))
+    per_category = Product.objects.values_list('category_id').annotate(count=Count('id'), last=Max('updated_at')).order_by()
+    direct = {}
+    modified = [category['updated_at'] for category in categories]
+    for category_id, count, last in per_category:
+        direct[category_id] = count
+        modified.append(last)
+    last_modified = max(filter(None, modified), default=None)
+
+    totals = {category['id']: 0 for category in categories}
+    for category in categories:
+        count = direct.get(category['id'], 0)
+        if count:
+            for ancestor_id in category['path'].split('/')[:-1]:
+                if int(ancestor_id) in totals:
+                    totals[int(ancestor_id)] += count
+
+    nodes = {}
+    roots = []
+    for category in categories:
+        if not category['is_active']:
+            continue
+        nodes[category['id']] = {
+            'id': category['id'],
+            'name': category['name'],
+            'product_count': totals[category['id']],
+            'subcategories': [],
+        }
+    for category in categories:
+        node = nodes.get(category['id'])
+        if node is None:
+            continue
+        if category['parent_id'] is None:
+            roots.append(node)
+        elif category['parent_id'] in nodes:
+            nodes[category['parent_id']]['subcategories'].append(node)
+    return roots, last_modified
+
+
+def tree_etag(request):
+    """ETag del árbol: cambia con la versión del catálogo"""
+    return f'categories-{get_version()}'
+
+
+def _cached_tree():
+    key = make_key('categories_json')
+    cached = cache.get(key)
+    if cached is None:
+        roots, last_modified = build_tree()
+        cached = (json.dumps({'categories': roots}), last_modified)
+        cache.set(key, cached, TREE_TIMEOUT)
+    return cached
+
+
+def tree_json():
+    """JSON del árbol, serializado una vez por versión del catálogo"""
+    return _cached_tree()[0]
+
+
+def tree_last_modified(request):
+    """Última modificación de categorías y productos, para Last-Modified"""
+    return _cached_tree()[1]
@@ -1,12 +1,52 @@
+import threading
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+from .catalog_cache import get_version
 from .models import Category
 
+# Categorías principales cacheadas en el proceso: (versión del catálogo, lista)
+_parent_categories = None
+_lock = threading.Lock()
+
+
+def get_parent_categories():
+    """
+    Categorías principales activas, consultadas una vez por proceso y por
+    versión del catálogo. La versión sale del cache compartido entre procesos
+    (CACHES en settings), así un cambio hecho en otro worker también se ve acá.
+    """
+    global _parent_categories
+    version = get_version()
+    cached = _parent_categories
+    if cached is None or cached[0] != version:
+        with _lock:
+            cached = _parent_categories
+            if cached is None or cached[0] != version:
+                cached = (version, list(Category.objects.filter(parent=None, is_active=True).order_by('name')))
+                _parent_categories = cached
+    return cached[1]
+
+
+def invalidate():
+    global _parent_categories
+    with _lock:
+        _parent_categories = None
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_parent_categories(sender, **kwargs):
+    invalidate()
+
+
 def categories(request):
     """
     Context processor para hacer que las categorías estén disponibles en todos los templates
     """
-    # Obtener solo las categorías principales (sin padre)
-    parent_categories = Category.objects.filter(parent=None, is_active=True).order_by('name')
-    
+    # Lazy: las páginas que no muestran el navbar no pagan ni la consulta ni el cache
     return {
-        'categories': parent_categories
+        'categories': SimpleLazyObject(get_parent_categories)
     }
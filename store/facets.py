@@ -0,0 +1,145 @@
+"""
+Filtros facetados para las páginas de categoría y subcategoría
+
+Los conteos de todas las facetas (rangos de precio, en stock, en oferta y
+subcategorías) salen de un único aggregate con Count(filter=...) y quedan
+en cache hasta el próximo cambio del catálogo. Son disyuntivos: cada faceta
+se cuenta sobre los productos que pasan los filtros activos de las demás, así
+el número de cada opción es lo que devuelve elegirla. El cache es por
+categoría y por combinación de filtros activos.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog_cache import make_key
+from .pagination import CURSOR_PARAM
+from .pricing import effective_price_range_q
+
+FACETS_TIMEOUT = 60 * 60
+
+# (clave, etiqueta, mínimo, máximo) en pesos argentinos
+PRICE_RANGES = [
+    ('0-50000', 'Hasta $50.000', None, 50000),
+    ('50000-200000', '$50.000 a $200.000', 50000, 200000),
+    ('200000-1000000', '$200.000 a $1.000.000', 200000, 1000000),
+    ('1000000-', 'Más de $1.000.000', 1000000, None),
+]
+
+IN_STOCK_Q = Q(stock__gt=0, is_available=True)
+ON_SALE_Q = Q(is_sale=True)
+
+
+def _price_q(low, high):
+    # Sobre el precio que paga el cliente, en la forma que usa los índices
+    # (category, price) y (category, sale_price)
+    return effective_price_range_q(low, high)
+
+
+def _price_range(key):
+    for range_key, label, low, high in PRICE_RANGES:
+        if range_key == key:
+            return low, high
+    return None
+
+
+def _active_filters(params, subcategories=()):
+    """Filtros elegidos en la URL (?price=&in_stock=1&on_sale=1&sub=) como {faceta: Q}"""
+    active = {}
+    price = _price_range(params.get('price', ''))
+    if price:
+        active['price'] = _price_q(*price)
+    if params.get('in_stock') == '1':
+        active['in_stock'] = IN_STOCK_Q
+    if params.get('on_sale') == '1':
+        active['on_sale'] = ON_SALE_Q
+    chosen = {str(s.id): s for s in subcategories}.get(params.get('sub', ''))
+    if chosen:
+        # La subcategoría elegida incluye todo su subárbol
+        active['sub'] = chosen.subtree_q('category__')
+    return active
+
+
+def _other_filters(active, facet=None):
+    """Q con los filtros activos de todas las facetas salvo facet"""
+    q = Q()
+    for name, facet_q in active.items():
+        if name != facet:
+            q &= facet_q
+    return q
+
+
+def _count(q):
+    return Count('id', filter=q) if q else Count('id')
+
+
+def apply_filters(queryset, params, subcategories=()):
+    """Aplica los filtros elegidos en la URL (?price=&in_stock=1&on_sale=1&sub=)"""
+    active = _active_filters(params, subcategories)
+    return queryset.filter(_other_filters(active))
+
+
+def _counts(category, queryset, subcategories, params):
+    active = _active_filters(params, subcategories)
+    combination = ','.join(f'{name}={params.get(name)}' for name in active)
+    key = make_key('facets', category.id, combination)
+    counts = cache.get(key)
+    if counts is None:
+        aggregates = {
+            'total': _count(_other_filters(active)),
+            'in_stock': _count(IN_STOCK_Q & _other_filters(active, 'in_stock')),
+            'on_sale': _count(ON_SALE_Q & _other_filters(active, 'on_sale')),
+        }
+        others = _other_filters(active, 'price')
+        for index, (range_key, label, low, high) in enumerate(PRICE_RANGES):
+            aggregates[f'price_{index}'] = _count(_price_q(low, high) & others)
+        others = _other_filters(active, 'sub')
+        for sub in subcategories:
+            aggregates[f'sub_{sub.id}'] = _count(sub.subtree_q('category__') & others)
+        counts = queryset.aggregate(**aggregates)
+        cache.set(key, counts, FACETS_TIMEOUT)
+    return counts
+
+
+def _toggle(params, name, value):
+    """Query string que activa (o desactiva, si ya estaba) un filtro"""
+    params = params.copy()
+    params.pop(CURSOR_PARAM, None)
+    active = params.get(name) == value
+    if active:
+        params.pop(name)
+    else:
+        params[name] = value
+    return params.urlencode(), active
+
+
+def build_facets(category, queryset, params, subcategories=()):
+    """
+    Facetas para el template: cada opción trae su conteo, si está activa y
+    la query string para alternarla. total son los productos que pasan todos
+    los filtros activos.
+    queryset: todos los productos de la categoría, sin filtrar
+    """
+    counts = _counts(category, queryset, subcategories, params)
+
+    def option(name, value, label, count):
+        query, active = _toggle(params, name, value)
+        return {'label': label, 'count': count, 'query': query, 'active': active}
+
+    clear = params.copy()
+    for name in ('price', 'in_stock', 'on_sale', 'sub', CURSOR_PARAM):
+        clear.pop(name, None)
+
+    return {
+        'total': counts['total'],
+        'price': [
+            option('price', range_key, label, counts[f'price_{index}'])
+            for index, (range_key, label, low, high) in enumerate(PRICE_RANGES)
+        ],
+        'in_stock': option('in_stock', '1', 'En stock', counts['in_stock']),
+        'on_sale': option('on_sale', '1', 'En oferta', counts['on_sale']),
+        'subcategories': [
+            option('sub', str(sub.id), sub.name, counts[f'sub_{sub.id}']) for sub in subcategories
+        ],
+        'is_filtered': any(name in params for name in ('price', 'in_stock', 'on_sale', 'sub')),
+        'clear_query': clear.urlencode(),
+    }
@@ -0,0 +1,219 @@
+"""
+Derivados responsive de las imágenes de productos
+
+Por cada imagen subida se generan versiones de varios anchos en WebP y en el
+formato de respaldo (JPEG, o PNG si la imagen tiene transparencia). Los
+archivos quedan al lado del original con el hash del contenido en el nombre
+("glock-3f2a9c1d7b4e-640w.webp"): si el original no cambia, los nombres
+tampoco, y se pueden servir con cache de larga duración. La lista de
+derivados se guarda en image_derivatives y el tag {% responsive_image %}
+arma el srcset a partir de ella.
+
+El trabajo con Pillow no se hace dentro del request que guarda el producto:
+el save solo encola una ImageTask y el comando process_image_tasks la
+procesa en un pool de procesos. Mientras tanto el manifiesto queda marcado
+como pendiente y el sitio muestra un placeholder.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .catalog_cache import bump_version
+from .models import Product, ProductImage, ImageTask
+
+# Anchos pensados para las tarjetas del listado (1x y 2x) y la ficha del producto
+WIDTHS = (320, 640, 960)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+HASH_LENGTH = 12
+MAX_ATTEMPTS = 3
+
+TASK_MODELS = {'product': Product, 'gallery': ProductImage}
+
+
+def content_hash(name, storage=default_storage):
+    """Hash del contenido del archivo; identifica la versión de la imagen"""
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as source:
+        for chunk in iter(lambda: source.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def derivative_name(name, digest, width, extension):
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    return posixpath.join(posixpath.dirname(name), f'{stem}-{digest}-{width}w.{extension}')
+
+
+def _encode(image, extension):
+    buffer = io.BytesIO()
+    if extension == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+    elif extension == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_derivatives(name, storage=default_storage, digest=None):
+    """
+    Genera los derivados de la imagen guardada en name y devuelve el manifiesto
+    para image_derivatives. Los archivos que ya existen con el mismo hash no
+    se vuelven a generar. Recibe y devuelve solo datos simples, así se puede
+    ejecutar en otro proceso.
+    """
+    digest = digest or content_hash(name, storage)
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        # Respetar la orientación de la cámara; al re-codificar se descarta el EXIF
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpg'
+
+    # Nunca agrandar: si el original es más chico, se usa su ancho
+    widths = sorted({min(width, image.width) for width in WIDTHS})
+    variants = {'webp': [], fallback: []}
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, round(image.height * width / image.width)), Image.LANCZOS
+        )
+        for extension in variants:
+            target = derivative_name(name, digest, width, extension)
+            if not storage.exists(target):
+                storage.save(target, ContentFile(_encode(resized, extension)))
+            variants[extension].append([width, target])
+    return {
+        'source': name,
+        'hash': digest,
+        'width': image.width,
+        'height': image.height,
+        'fallback': fallback,
+        'variants': variants,
+    }
+
+
+def optimize_image(name, known_hash=None, storage=default_storage):
+    """
+    Para optimize_media: devuelve None si el contenido no cambió desde el
+    manifiesto anterior (known_hash) y, si no, el manifiesto nuevo.
+    """
+    digest = content_hash(name, storage)
+    if digest == known_hash:
+        return None
+    return build_derivatives(name, storage, digest)
+
+
+def is_stale(instance):
+    """True si la imagen cambió desde que se generaron sus derivados"""
+    if not instance.image:
+        return bool(instance.image_derivatives)
+    return (instance.image_derivatives or {}).get('source') != instance.image.name
+
+
+def save_derivatives(instance, manifest, bump=True):
+    """
+    Guarda el manifiesto sin pasar por save() y marca el producto como
+    modificado, para que los fragmentos y páginas cacheados lo tomen.
+    bump=False deja la invalidación de las páginas para el que llama
+    (procesos por lotes que invalidan una sola vez al final).
+    """
+    model = type(instance)
+    instance.image_derivatives = manifest
+    if isinstance(instance, Product):
+        instance.updated_at = timezone.now()
+        model.objects.filter(pk=instance.pk).update(image_derivatives=manifest, updated_at=instance.updated_at)
+    else:
+        model.objects.filter(pk=instance.pk).update(image_derivatives=manifest)
+        # Si es la principal, el producto guarda una copia del manifiesto para los listados
+        instance.product.refresh_primary_image()
+    if bump:
+        bump_version()
+
+
+def enqueue(instance):
+    """
+    Encola la generación de derivados y marca el manifiesto como pendiente.
+    Si el producto se guarda varias veces antes de que corra el worker, la
+    misma tarea pendiente se actualiza en lugar de duplicarse.
+    """
+    if not is_stale(instance):
+        return
+    if not instance.image:
+        save_derivatives(instance, {})
+        return
+    kind = 'product' if isinstance(instance, Product) else 'gallery'
+    name = instance.image.name
+    ImageTask.objects.update_or_create(
+        kind=kind, object_id=instance.pk, status='pending',
+        defaults={'image_name': name, 'attempts': 0, 'last_error': ''},
+    )
+    save_derivatives(instance, {'source': name, 'pending': True})
+
+
+def claim_tasks(limit):
+    """Toma hasta limit tareas pendientes; el UPDATE condicional evita que dos workers tomen la misma"""
+    claimed = []
+    for task in ImageTask.objects.filter(status='pending')[:limit]:
+        # update() no toca auto_now: sin updated_at, una tarea que esperó en la cola
+        # parecería abandonada apenas tomada y release_stale_tasks la devolvería
+        claimed_now = ImageTask.objects.filter(pk=task.pk, status='pending').update(
+            status='running', attempts=F('attempts') + 1, updated_at=timezone.now(),
+        )
+        if claimed_now:
+            task.status = 'running'
+            task.attempts += 1
+            claimed.append(task)
+    return claimed
+
+
+def complete_task(task, manifest):
+    instance = TASK_MODELS[task.kind].objects.filter(pk=task.object_id).first()
+    # Si la imagen cambió mientras se procesaba, ya hay otra tarea encolada para la nueva
+    if instance is not None and instance.image.name == task.image_name:
+        save_derivatives(instance, manifest)
+    ImageTask.objects.filter(pk=task.pk).update(status='done', last_error='')
+
+
+def fail_task(task, error):
+    """
+    Vuelve a encolar la tarea hasta MAX_ATTEMPTS; después queda como fallida
+    y el manifiesto deja de estar pendiente, así el sitio muestra el original
+    en lugar del placeholder
+    """
+    newer = ImageTask.objects.filter(kind=task.kind, object_id=task.object_id, status='pending').exists()
+    retry = task.attempts < MAX_ATTEMPTS and not newer
+    ImageTask.objects.filter(pk=task.pk).update(
+        status='pending' if retry else 'failed', last_error=str(error), updated_at=timezone.now(),
+    )
+    if retry or newer:
+        return
+    instance = TASK_MODELS[task.kind].objects.filter(pk=task.object_id).first()
+    if instance is not None and instance.image.name == task.image_name:
+        save_derivatives(instance, {'source': task.image_name})
+
+
+def release_stale_tasks(older_than):
+    """Devuelve a la cola las tareas de un worker que se cortó a mitad de camino"""
+    released = 0
+    for task in ImageTask.objects.filter(status='running', updated_at__lt=timezone.now() - older_than):
+        fail_task(task, 'El worker se interrumpió')
+        released += 1
+    return released
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        enqueue(instance)
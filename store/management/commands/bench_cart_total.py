@@ -0,0 +1,50 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from cart.cart import Cart
+from store.models import Product, Category
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide cuánto tarda el total del carrito según la cantidad de líneas '
+        '(debe crecer en forma lineal y resolverse en una consulta). Los '
+        'productos de prueba se crean en una transacción que se descarta.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,50,500', help='Cantidades de líneas a medir, separadas por comas')
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por tamaño (se informa la mejor)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark del carrito')
+            Product.objects.bulk_create([
+                Product(name=f'Insumo {i}', price=100 + i, is_sale=i % 2 == 0, sale_price=50, category=category)
+                for i in range(max(sizes))
+            ])
+            ids = list(Product.objects.filter(category=category).values_list('id', flat=True))
+            for size in sizes:
+                best, queries = self.measure(ids[:size], options['repeat'])
+                self.stdout.write(f'{size:>6} líneas: {best * 1000:8.2f} ms, {queries} consulta(s)')
+            transaction.set_rollback(True)
+
+    def measure(self, ids, repeat):
+        best = None
+        for _ in range(repeat):
+            request = RequestFactory().get('/')
+            request.session = {'session_key': {str(pk): 2 for pk in ids}}
+            request.user = AnonymousUser()
+            cart = Cart(request)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                cart.cart_total()
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(queries)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store import recommendations
+from store.models import ProductCooccurrence
+
+
+class Command(BaseCommand):
+    help = (
+        'Actualiza las recomendaciones "comprados juntos" con los pedidos nuevos desde la última corrida '
+        '(pensado para correr periódicamente, por ejemplo desde cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Descartar lo calculado y procesar todos los pedidos')
+
+    def handle(self, *args, **options):
+        run = recommendations.update_recommendations(rebuild=options['rebuild'])
+        if run is None:
+            self.stdout.write('No hay pedidos nuevos desde la última corrida.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Pedidos procesados: {run.orders} (hasta el #{run.last_order_id}), '
+            f'pares guardados: {ProductCooccurrence.objects.count()}'
+        ))
@@ -0,0 +1,94 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store import images
+from store.catalog_cache import bump_version
+from store.models import Product, ProductImage, ImageTask
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los derivados responsive de todas las imágenes de productos en procesos paralelos. '
+        'Cada imagen terminada queda guardada en su manifiesto: si se corta, la próxima corrida '
+        'saltea las imágenes cuyo contenido (hash) no cambió.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos para el trabajo con Pillow (por defecto, uno por núcleo)')
+        parser.add_argument('--force', action='store_true', help='Regenerar aunque el hash no haya cambiado')
+
+    def collect(self):
+        """Archivo -> filas que lo usan, y el hash ya procesado si todas coinciden"""
+        references = defaultdict(list)
+        for model in (Product, ProductImage):
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True):
+                references[instance.image.name].append(instance)
+        work = []
+        for name, instances in references.items():
+            manifests = [instance.image_derivatives or {} for instance in instances]
+            done = [m for m in manifests if m.get('source') == name and m.get('variants')]
+            hashes = {m.get('hash') for m in done}
+            # Si alguna fila quedó sin derivados, se procesa igual para completarla
+            known = hashes.pop() if len(done) == len(manifests) and len(hashes) == 1 else None
+            work.append((name, known))
+        return references, work
+
+    def handle(self, *args, **options):
+        references, work = self.collect()
+        total = len(work)
+        self.stdout.write(f'Imágenes referenciadas: {total}')
+
+        processed = skipped = failed = 0
+        original_bytes = optimized_bytes = 0
+        # Los procesos hijos no usan la base: no deben heredar la conexión abierta
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=django.setup)
+        try:
+            futures = {
+                executor.submit(images.optimize_image, name, None if options['force'] else known): name
+                for name, known in work
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'❌ {name}: {e}')
+                    continue
+                if manifest is None:
+                    skipped += 1
+                    continue
+                # Punto de control: el manifiesto guardado marca la imagen como terminada
+                for instance in references[name]:
+                    images.save_derivatives(instance, manifest, bump=False)
+                ImageTask.objects.filter(image_name=name, status='pending').update(status='done')
+                processed += 1
+                original = default_storage.size(name)
+                optimized = default_storage.size(manifest['variants']['webp'][-1][1])
+                original_bytes += original
+                optimized_bytes += optimized
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'[{done}/{total}] {name}: {original} -> {optimized} bytes')
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.stdout.write(self.style.WARNING('Interrumpido: volvé a correr el comando para continuar desde acá'))
+        else:
+            executor.shutdown()
+        finally:
+            if processed:
+                bump_version()
+
+        # Los originales no se borran: la diferencia es lo que se transfiere de menos por descarga
+        per_request = original_bytes - optimized_bytes
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Procesadas: {processed}, sin cambios: {skipped}, con error: {failed}. '
+            f'Bytes originales: {original_bytes}, WebP más grande: {optimized_bytes}, '
+            f'menos por descarga: {per_request} bytes'
+        ))
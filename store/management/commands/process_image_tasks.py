@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store import images
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de imágenes (derivados responsive) en un pool de procesos, fuera del request del admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos para el trabajo con Pillow (por defecto, uno por núcleo)')
+        parser.add_argument('--batch', type=int, default=0, help='Tareas tomadas por vuelta (por defecto, 4 por proceso)')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true', help='Vaciar la cola y terminar en lugar de quedarse esperando')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch = options['batch'] or workers * 4
+
+        released = images.release_stale_tasks(timedelta(minutes=10))
+        if released:
+            self.stdout.write(self.style.WARNING(f'{released} tareas interrumpidas volvieron a la cola'))
+
+        # Los procesos hijos no usan la base: no deben heredar la conexión abierta
+        connections.close_all()
+        done = failed = 0
+        # django.setup en cada proceso hace que funcione también con "spawn" (macOS/Windows)
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            while True:
+                tasks = images.claim_tasks(batch)
+                if not tasks:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                futures = {executor.submit(images.build_derivatives, task.image_name): task for task in tasks}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        manifest = future.result()
+                    except Exception as e:
+                        images.fail_task(task, e)
+                        failed += 1
+                        self.stderr.write(f'❌ {task.image_name}: {e}')
+                    else:
+                        images.complete_task(task, manifest)
+                        done += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Imágenes procesadas: {done}, con error: {failed}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.models import Product
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los índices de búsqueda de productos (full-text y trigramas) (útil después de cargas masivas con update/bulk_create)'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('El motor de base de datos no tiene índice full-text; se usa búsqueda simple.'))
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'✅ Índice reconstruido: {Product.objects.count()} productos'))
@@ -0,0 +1,126 @@
+"""
+Servidor de archivos media para producción
+
+django.conf.urls.static solo sirve media con DEBUG y sin cabeceras de cache.
+Esta vista lo reemplaza en todos los entornos, al estilo de WhiteNoise:
+
+- ETag fuerte y Last-Modified, con respuestas 304 a los GET condicionales.
+- Cache-Control de un año e immutable para los derivados con hash en el nombre
+  (ver store/images.py); los originales se revalidan cada hora.
+- Requests de rango (Range / If-Range) con respuestas 206, para que los
+  navegadores y CDNs puedan retomar descargas.
+- Las respuestas completas usan FileResponse: con gunicorn van por
+  wsgi.file_wrapper, que envía el archivo con sendfile (sin copiarlo a Python).
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+
+# "<nombre>-<hash de 12>-<ancho>w.<ext>": el contenido de ese nombre no cambia nunca
+HASHED_NAME = re.compile(r'-[0-9a-f]{12}-\d+w\.\w+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=3600'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+IGNORE_RANGE = 'ignore'
+
+
+def _parse_range(header, size):
+    """
+    (inicio, fin) inclusive de un rango simple de bytes; None si no se puede
+    satisfacer e IGNORE_RANGE para lo que no soportamos (varios rangos, otras
+    unidades, sintaxis inválida): según RFC 9110 se ignora y va el archivo entero
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return IGNORE_RANGE
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N: los últimos N bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return IGNORE_RANGE
+    if start >= size:
+        return None
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(last_modified, usegmt=True),
+        'Cache-Control': IMMUTABLE_CACHE if HASHED_NAME.search(path) else DEFAULT_CACHE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified.headers.setdefault(header, value)
+        return not_modified
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    # If-Range: el rango solo vale si el cliente tiene la misma versión del archivo
+    if range_header and request.META.get('HTTP_IF_RANGE', etag) in (etag, headers['Last-Modified']):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range and byte_range != IGNORE_RANGE:
+        start, end = byte_range
+        length = end - start + 1
+        body = () if request.method == 'HEAD' else _read_range(full_path, start, length)
+        response = StreamingHttpResponse(body, status=206, content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['Content-Length'] = str(size)
+        return response
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+    return response
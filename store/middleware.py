@@ -67,11 +67,14 @@ class VisitCounterMiddleware(MiddlewareMixin):
         # Solo contar visitas GET (no AJAX, POST, etc.)
         if request.method != 'GET':
             return None
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return None
         
-        # Ignorar ciertos paths
+        # Ignorar ciertos paths (incluidos los endpoints JSON que piden las páginas)
         ignore_paths = [
             '/admin/', '/static/', '/media/', '/favicon.ico',
-            '/robots.txt', '/sitemap.xml'
+            '/robots.txt', '/sitemap.xml',
+            '/api/', '/search/autocomplete/', '/cart/badge/',
         ]
         
         for ignore_path in ignore_paths:
@@ -0,0 +1,70 @@
+import unicodedata
+
+from django.db import migrations
+
+# Copia congelada de store.search al momento de esta migración: los cambios
+# posteriores de ese módulo no deben alterar lo que hace una migración vieja
+FTS_TABLE = 'store_product_fts'
+
+
+def normalize(text):
+    normalized = unicodedata.normalize('NFD', text or '')
+    return ''.join(c for c in normalized if unicodedata.category(c) != 'Mn').lower().strip()
+
+
+def build_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        return
+    Product = apps.get_model('store', 'Product')
+    rows = Product.objects.using(conn.alias).values_list('id', 'name', 'description', 'category__name')
+    params = [
+        (pk, normalize(name), normalize(description), normalize(category))
+        for pk, name, description, category in rows.iterator()
+    ]
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                'USING fts5(name, description, category, tokenize = "unicode61 remove_diacritics 2")'
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                params,
+            )
+        else:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {FTS_TABLE} ('
+                'product_id bigint PRIMARY KEY REFERENCES store_product(id) ON DELETE CASCADE, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {FTS_TABLE}_document_idx '
+                f'ON {FTS_TABLE} USING GIN (document)'
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'B')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor in ('sqlite', 'postgresql'):
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_alter_product_image_alter_product_price_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
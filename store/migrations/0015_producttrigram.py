@@ -0,0 +1,53 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copia congelada de store.search.trigrams al momento de esta migración
+def trigrams(text):
+    normalized = unicodedata.normalize('NFD', text or '')
+    text = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn').lower().strip()
+    grams = set()
+    for word in re.findall(r'\w+', text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def build_trigrams(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductTrigram = apps.get_model('store', 'ProductTrigram')
+    conn = schema_editor.connection
+    rows = Product.objects.using(conn.alias).values_list('id', 'name').iterator()
+    params = [(pk, gram) for pk, name in rows for gram in trigrams(name)]
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {ProductTrigram._meta.db_table} (product_id, trigram) VALUES (%s, %s)',
+            params,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de Producto',
+                'verbose_name_plural': 'Trigramas de Productos',
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'product'), name='unique_product_trigram')],
+            },
+        ),
+        migrations.RunPython(build_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    db_alias = schema_editor.connection.alias
+    used = set()
+    for category in Category.objects.using(db_alias).order_by('id'):
+        slug = slugify(category.name) or str(category.id)
+        # Nombres distintos con el mismo slug (p. ej. "Ópticas" y "Opticas")
+        if (category.parent_id, slug) in used:
+            slug = f'{slug}-{category.id}'
+        used.add((category.parent_id, slug))
+        category.slug = slug
+        category.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_category_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(blank=True, db_index=False, editable=False, max_length=60),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(condition=models.Q(('parent__isnull', True)), fields=('slug',), name='unique_category_slug'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('parent', 'slug'), name='unique_subcategory_slug'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    db_alias = schema_editor.connection.alias
+    parents = dict(Category.objects.using(db_alias).values_list('id', 'parent_id'))
+    paths = {}
+
+    def path_for(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (path_for(parent_id) if parent_id else '') + f'{pk}/'
+        return paths[pk]
+
+    for pk in parents:
+        Category.objects.using(db_alias).filter(pk=pk).update(path=path_for(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_category_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def populate_primary_images(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductImage = apps.get_model('store', 'ProductImage')
+    db_alias = schema_editor.connection.alias
+    gallery = dict(
+        ProductImage.objects.using(db_alias).filter(is_primary=True).values_list('product_id', 'image')
+    )
+    for pk, image in Product.objects.using(db_alias).values_list('id', 'image'):
+        primary = gallery.get(pk) or image or ''
+        if primary:
+            Product.objects.using(db_alias).filter(pk=pk).update(primary_image=primary)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_imagetask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+        migrations.RunPython(populate_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Cálculo de Recomendaciones',
+                'verbose_name_plural': 'Cálculos de Recomendaciones',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurrences', to='store.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'verbose_name': 'Co-ocurrencia de Productos',
+                'verbose_name_plural': 'Co-ocurrencias de Productos',
+                'indexes': [models.Index(fields=['product', '-count'], name='cooccurrence_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'related'), name='unique_product_cooccurrence')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_product_cooccurrence'),
+        # Los carritos guardados se copian a CartLine antes de borrar la columna
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='old_cart',
+        ),
+    ]
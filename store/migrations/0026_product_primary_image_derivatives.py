@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def copy_gallery_manifests(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductImage = apps.get_model('store', 'ProductImage')
+    db_alias = schema_editor.connection.alias
+    primaries = ProductImage.objects.using(db_alias).filter(is_primary=True).exclude(image='')
+    for product_id, manifest in primaries.values_list('product_id', 'image_derivatives'):
+        if manifest:
+            Product.objects.using(db_alias).filter(pk=product_id).update(primary_image_derivatives=manifest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_remove_profile_old_cart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(copy_gallery_manifests, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 import datetime
+import uuid
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
+from django.urls import reverse
+from django.utils.text import slugify
+from .pricing import effective_price, effective_price_expression
 
 
 # Create Customer Profile
@@ -15,7 +19,6 @@ class Profile(models.Model):
 	state = models.CharField(max_length=200, blank=True)
 	zipcode = models.CharField(max_length=200, blank=True)
 	country = models.CharField(max_length=200, blank=True)
-	old_cart = models.CharField(max_length=200, blank=True, null=True)
 
 	def __str__(self):
 		return self.user.username
@@ -42,25 +45,42 @@ post_save.connect(create_profile, sender=User)
 # Categories of Products
 class Category(models.Model):
 	name = models.CharField(max_length=50)
+	# Slug persistido (se sincroniza con el nombre en save) para resolver URLs con un índice
+	slug = models.SlugField(max_length=60, blank=True, editable=False, db_index=False)
 	parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subcategories')
+	# Camino materializado con los ids de los ancestros y el propio ("3/17/42/").
+	# Los descendientes de un nodo, a cualquier profundidad, son un rango del índice.
+	path = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
 	description = models.TextField(blank=True, null=True)
 	is_active = models.BooleanField(default=True)
+	updated_at = models.DateTimeField(auto_now=True, null=True)
 
 	def __str__(self):
 		if self.parent:
 			return f"{self.parent.name} > {self.name}"
 		return self.name
 
+	def subtree_q(self, prefix=''):
+		"""
+		Q con esta categoría y todos sus descendientes, como rango sobre el
+		camino: "3/" <= path < "30" ('0' es el carácter siguiente a '/')
+		prefix: ruta hasta la categoría desde otro modelo, ej. 'category__'
+		"""
+		return models.Q(**{
+			f'{prefix}path__gte': self.path,
+			f'{prefix}path__lt': self.path[:-1] + '0',
+		})
+
+	def get_descendants(self, include_self=False):
+		"""Subcategorías a cualquier profundidad, en una sola consulta"""
+		descendants = Category.objects.filter(self.subtree_q())
+		if not include_self:
+			descendants = descendants.exclude(pk=self.pk)
+		return descendants
+
 	def get_all_products(self):
-		"""Obtiene todos los productos de esta categoría y sus subcategorías"""
-		from django.db.models import Q
-		if self.subcategories.exists():
-			# Si tiene subcategorías, incluir productos de todas las subcategorías
-			subcategory_ids = [sub.id for sub in self.subcategories.all()]
-			return Product.objects.filter(Q(category=self) | Q(category__id__in=subcategory_ids))
-		else:
-			# Si no tiene subcategorías, solo productos de esta categoría
-			return Product.objects.filter(category=self)
+		"""Obtiene todos los productos de esta categoría y sus subcategorías, a cualquier profundidad"""
+		return Product.objects.filter(self.subtree_q('category__'))
 
 	@property
 	def is_parent(self):
@@ -72,44 +92,128 @@ class Category(models.Model):
 	
 	def get_slug(self):
 		"""Genera un slug único para esta categoría"""
-		from django.utils.text import slugify
-		return slugify(self.name)
+		return self.slug or slugify(self.name)
 	
 	def get_url_slug(self):
 		"""Obtiene el slug para usar en URLs"""
 		return self.get_slug()
+
+	def get_absolute_url(self):
+		"""URL canónica de la categoría o subcategoría"""
+		if self.parent:
+			return reverse('subcategory', args=[self.parent.get_slug(), self.get_slug()])
+		return reverse('category', args=[self.get_slug()])
 	
+	def _move_subtree(self):
+		"""
+		Recalcula el camino antes de guardar. Si la categoría cambió de padre,
+		un único UPDATE reescribe el prefijo de todo su subárbol; el resto de la
+		tabla no se toca. Corre antes de super().save() para que los receptores
+		de post_save (versión del catálogo, índice de búsqueda) ya vean los
+		caminos nuevos de los descendientes.
+		"""
+		from django.db.models.functions import Concat, Substr
+
+		# Los caminos se leen de la base: las instancias en memoria pueden estar viejas
+		parent_path = ''
+		if self.parent_id:
+			parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+		old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first()
+		new_path = f'{parent_path}{self.pk}/'
+		if old_path and old_path != new_path:
+			Category.objects.filter(
+				path__gte=old_path, path__lt=old_path[:-1] + '0'
+			).update(path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1)))
+		self.path = new_path
+
+	def _slug_taken(self, slug):
+		return Category.objects.filter(parent_id=self.parent_id, slug=slug).exclude(pk=self.pk).exists()
+
+	def _sync_slug(self):
+		"""
+		Regenera el slug solo si falta o cambió el nombre o el padre. Si otra
+		categoría del mismo padre ya lo usa ("Ópticas" y "Opticas") lleva el
+		sufijo -{id}, igual que en la migración 0018; así guardar de nuevo no
+		pisa el slug deduplicado. Devuelve True si hay que completar el sufijo
+		después del INSERT (categoría nueva, todavía sin id).
+		"""
+		if self.pk and self.slug:
+			stored = Category.objects.filter(pk=self.pk).values_list('name', 'parent_id').first()
+			if stored == (self.name, self.parent_id):
+				return False
+		slug = slugify(self.name)
+		if slug and not self._slug_taken(slug):
+			self.slug = slug
+			return False
+		if self.pk:
+			self.slug = f'{slug}-{self.pk}' if slug else str(self.pk)
+			return False
+		# Slug provisorio y único hasta conocer el id
+		self.slug = f'{slug}-{uuid.uuid4().hex[:12]}'
+		return True
+
 	def save(self, *args, **kwargs):
 		"""Override save para validaciones adicionales"""
-		# Validar que no haya duplicados
+		# Atómico: una falla a mitad de camino no deja el árbol movido a medias
+		with transaction.atomic():
+			self._save(*args, **kwargs)
+
+	def _save(self, *args, **kwargs):
+		old_slug = self.slug
+		needs_suffix = self._sync_slug()
+		update_fields = kwargs.get('update_fields')
+		if update_fields is not None and self.slug != old_slug:
+			kwargs['update_fields'] = set(update_fields) | {'slug'}
+
+		# Validar que no haya nombres duplicados (el slug ya quedó único)
 		if self.parent:
 			# Para subcategorías, verificar duplicados dentro del mismo padre
-			existing = Category.objects.filter(
-				name__iexact=self.name, 
-				parent=self.parent
-			).exclude(id=self.id)
+			existing = Category.objects.filter(name__iexact=self.name, parent=self.parent).exclude(id=self.id)
 			if existing.exists():
 				raise ValueError(f"Ya existe una subcategoría '{self.name}' en '{self.parent.name}'")
 		else:
 			# Para categorías principales, verificar duplicados globales
-			existing = Category.objects.filter(
-				name__iexact=self.name, 
-				parent=None
-			).exclude(id=self.id)
+			existing = Category.objects.filter(name__iexact=self.name, parent=None).exclude(id=self.id)
 			if existing.exists():
 				raise ValueError(f"Ya existe una categoría principal '{self.name}'")
+
+		# No se puede colgar una categoría de sí misma ni de un descendiente
+		if self.pk and self.parent_id and Category.objects.filter(
+			self.subtree_q() if self.path else models.Q(pk=self.pk), pk=self.parent_id
+		).exists():
+			raise ValueError(f"'{self.name}' no puede ser subcategoría de sí misma ni de sus subcategorías")
 		
+		created = self.pk is None
+		if not created:
+			self._move_subtree()
+			if kwargs.get('update_fields') is not None:
+				kwargs['update_fields'] = set(kwargs['update_fields']) | {'path'}
 		super().save(*args, **kwargs)
+		if created:
+			# El camino (y el sufijo del slug, si hizo falta) necesitan el id;
+			# una categoría nueva todavía no tiene descendientes
+			self._move_subtree()
+			if needs_suffix:
+				base = slugify(self.name)
+				self.slug = f'{base}-{self.pk}' if base else str(self.pk)
+			Category.objects.filter(pk=self.pk).update(path=self.path, slug=self.slug)
 
 	class Meta:
 		verbose_name = "Categoría"
 		verbose_name_plural = "Categorías"
+		constraints = [
+			# Cada URL resuelve con un único lookup indexado
+			models.UniqueConstraint(fields=['slug'], condition=models.Q(parent__isnull=True), name='unique_category_slug'),
+			models.UniqueConstraint(fields=['parent', 'slug'], name='unique_subcategory_slug'),
+		]
 
 
 # Modelo para imágenes adicionales del producto
 class ProductImage(models.Model):
 	product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='additional_images')
 	image = models.ImageField(upload_to='uploads/product/gallery/')
+	# Manifiesto de los derivados responsive (ver store/images.py)
+	image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 	alt_text = models.CharField(max_length=200, blank=True, null=True)
 	is_primary = models.BooleanField(default=False)
 	order = models.PositiveIntegerField(default=0)
@@ -127,6 +231,12 @@ class ProductImage(models.Model):
 		if self.is_primary:
 			ProductImage.objects.filter(product=self.product, is_primary=True).exclude(id=self.id).update(is_primary=False)
 		super().save(*args, **kwargs)
+		self.product.refresh_primary_image()
+
+	def delete(self, *args, **kwargs):
+		result = super().delete(*args, **kwargs)
+		self.product.refresh_primary_image()
+		return result
 
 
 # Customers
@@ -147,6 +257,12 @@ class Customer(models.Model):
 
 
 
+class ProductQuerySet(models.QuerySet):
+	def with_effective_price(self):
+		"""Anota effective_price (el precio que paga el cliente) calculado en SQL"""
+		return self.annotate(effective_price=effective_price_expression())
+
+
 # All of our Products
 class Product(models.Model):
 	name = models.CharField(max_length=100)
@@ -154,16 +270,69 @@ class Product(models.Model):
 	category = models.ForeignKey(Category, on_delete=models.CASCADE, default=1)
 	description = models.CharField(max_length=250, default='', blank=True, null=True)
 	image = models.ImageField(blank=True, null=True, upload_to='uploads/product/')
+	# Manifiesto de los derivados responsive (ver store/images.py)
+	image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 	# Add Sale Stuff
 	is_sale = models.BooleanField(default=False)
 	sale_price = models.DecimalField(decimal_places=2, default=0, help_text='Precio de oferta en pesos argentinos (ARS)', max_digits=12)
 	# Add Stock Management
 	stock = models.PositiveIntegerField(default=0, help_text="Cantidad disponible en inventario")
 	is_available = models.BooleanField(default=True, help_text="Disponible para compra")
+	# Cambia en cada save (y cuando cambian sus imágenes); versiona los caches del producto
+	updated_at = models.DateTimeField(auto_now=True, null=True)
+	# Imagen principal desnormalizada: la de galería marcada como primaria o, si no hay, image.
+	# La mantienen save() y ProductImage.save/delete; los listados y el carrito no consultan la galería.
+	primary_image = models.ImageField(blank=True, editable=False)
+	# Manifiesto de derivados de la principal cuando es una imagen de la galería
+	# (si es image, el manifiesto es image_derivatives); ver store/images.py
+	primary_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+	objects = ProductQuerySet.as_manager()
 
 	def __str__(self):
 		return self.name
 
+	def save(self, *args, **kwargs):
+		# Subir antes la imagen nueva, así primary_image toma el nombre definitivo
+		# (con upload_to) y no el del archivo subido
+		if self.image and not self.image._committed:
+			self.image.save(self.image.name, self.image.file, save=False)
+		self.primary_image, self.primary_image_derivatives = self.compute_primary_image()
+		super().save(*args, **kwargs)
+
+	@property
+	def cache_version(self):
+		"""Versión del producto para las claves de cache de fragmentos"""
+		return int(self.updated_at.timestamp() * 1000000) if self.updated_at else 0
+
+	def compute_primary_image(self):
+		"""
+		(nombre de archivo, manifiesto de derivados) de la imagen principal según
+		la galería y la imagen propia; el manifiesto solo se copia de la galería
+		"""
+		if self.pk:
+			row = self.additional_images.filter(is_primary=True).values_list('image', 'image_derivatives').first()
+			if row and row[0]:
+				return row[0], row[1] or {}
+		return (self.image.name if self.image else ''), {}
+
+	def refresh_primary_image(self):
+		"""Recalcula primary_image y marca el producto como modificado sin pasar por save()"""
+		from django.utils import timezone
+		self.primary_image, self.primary_image_derivatives = self.compute_primary_image()
+		self.updated_at = timezone.now()
+		Product.objects.filter(pk=self.pk).update(
+			primary_image=self.primary_image.name,
+			primary_image_derivatives=self.primary_image_derivatives,
+			updated_at=self.updated_at,
+		)
+
+	def get_effective_price(self):
+		"""Precio que paga el cliente (toma la anotación de with_effective_price si está)"""
+		if 'effective_price' in self.__dict__:
+			return self.effective_price
+		return effective_price(self)
+
 	@property
 	def is_in_stock(self):
 		"""Verifica si el producto tiene stock disponible"""
@@ -205,21 +374,116 @@ class Product(models.Model):
 		return images
 
 	def get_primary_image(self):
-		"""Obtiene la imagen principal del producto"""
-		# Buscar imagen marcada como primaria en las adicionales
-		primary_additional = self.additional_images.filter(is_primary=True).first()
-		if primary_additional:
-			return primary_additional.image.url
-		
-		# Si no hay imagen primaria adicional, usar la imagen del modelo principal
-		if self.image:
-			return self.image.url
-		
+		"""Obtiene la URL de la imagen principal del producto (sin consultas)"""
+		if self.primary_image:
+			return self.primary_image.url
 		return None
 
 	class Meta:
 		verbose_name = "Producto"
 		verbose_name_plural = "Productos"
+		indexes = [
+			# Listados por categoría paginados por cursor (category_id = ? AND id < ? ORDER BY id DESC)
+			models.Index(fields=['category', '-id'], name='product_category_id_idx'),
+			# Filtro por rango de precio efectivo dentro de una categoría (ver
+			# pricing.effective_price_range_q): price para los productos sin oferta
+			# y sale_price, solo de los que están en oferta, para el resto
+			models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+			models.Index(fields=['category', 'sale_price'], name='product_category_sale_idx', condition=models.Q(is_sale=True)),
+		]
+
+
+# Índice de trigramas de nombres de productos (búsqueda tolerante a errores)
+class ProductTrigram(models.Model):
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='trigrams')
+	trigram = models.CharField(max_length=3)
+
+	def __str__(self):
+		return f"{self.trigram!r} - {self.product_id}"
+
+	class Meta:
+		constraints = [
+			# El índice (trigram, product) resuelve la búsqueda sin leer la tabla
+			models.UniqueConstraint(fields=['trigram', 'product'], name='unique_product_trigram'),
+		]
+		verbose_name = "Trigrama de Producto"
+		verbose_name_plural = "Trigramas de Productos"
+
+
+# Productos comprados juntos: matriz dispersa de co-ocurrencias en pedidos
+# (la actualiza el comando build_recommendations, ver store/recommendations.py)
+class ProductCooccurrence(models.Model):
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cooccurrences')
+	related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+	count = models.PositiveIntegerField(default=0)
+
+	def __str__(self):
+		return f"{self.product_id} + {self.related_id} ({self.count})"
+
+	class Meta:
+		indexes = [
+			# Los vecinos más frecuentes de un producto son el comienzo de un rango del índice
+			models.Index(fields=['product', '-count'], name='cooccurrence_top_idx'),
+		]
+		constraints = [
+			models.UniqueConstraint(fields=['product', 'related'], name='unique_product_cooccurrence'),
+		]
+		verbose_name = "Co-ocurrencia de Productos"
+		verbose_name_plural = "Co-ocurrencias de Productos"
+
+
+# Corridas del cálculo de recomendaciones: la última marca hasta qué pedido se procesó
+class RecommendationRun(models.Model):
+	last_order_id = models.PositiveBigIntegerField(default=0)
+	orders = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"Hasta el pedido #{self.last_order_id} ({self.orders} pedidos)"
+
+	class Meta:
+		ordering = ['-id']
+		verbose_name = "Cálculo de Recomendaciones"
+		verbose_name_plural = "Cálculos de Recomendaciones"
+
+
+# Cola de procesamiento de imágenes (la atiende el comando process_image_tasks)
+class ImageTask(models.Model):
+	KIND_CHOICES = [
+		('product', 'Imagen principal'),
+		('gallery', 'Imagen de galería'),
+	]
+	STATUS_CHOICES = [
+		('pending', 'Pendiente'),
+		('running', 'En proceso'),
+		('done', 'Terminada'),
+		('failed', 'Fallida'),
+	]
+
+	kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+	object_id = models.PositiveBigIntegerField()
+	image_name = models.CharField(max_length=255)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+	attempts = models.PositiveSmallIntegerField(default=0)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.get_kind_display()} #{self.object_id} ({self.get_status_display()})"
+
+	class Meta:
+		ordering = ['id']
+		indexes = [
+			# El worker toma las pendientes en orden de llegada
+			models.Index(fields=['status', 'id'], name='imagetask_status_id_idx'),
+		]
+		constraints = [
+			# Una sola tarea pendiente por imagen: guardar dos veces no duplica el trabajo
+			models.UniqueConstraint(fields=['kind', 'object_id'], condition=models.Q(status='pending'), name='unique_pending_image_task'),
+		]
+		verbose_name = "Tarea de Imagen"
+		verbose_name_plural = "Tareas de Imágenes"
 
 
 # Customer Orders
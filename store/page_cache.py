@@ -0,0 +1,131 @@
+"""
+Cache de página completa para visitantes anónimos
+
+Las páginas del catálogo son iguales para todos los anónimos salvo el
+contador del carrito y los mensajes flash. Mientras no haya mensajes
+pendientes, el HTML se guarda en cache atado a la versión del catálogo (así
+cualquier cambio de productos o categorías lo descarta) y las próximas
+visitas lo reciben sin pasar por el ORM ni por los templates. El contador
+del carrito se completa desde el navegador con cart_badge. Las páginas y la
+versión viven en el cache compartido entre procesos (CACHES en settings), así
+una invalidación hecha por un comando (process_image_tasks, optimize_media,
+build_recommendations) alcanza a todos los workers.
+
+Las mismas páginas responden GETs condicionales: el ETag es la versión del
+catálogo y Last-Modified sale del updated_at de productos y categorías y de
+la hora del último cambio del catálogo, así un
+visitante que repite la visita recibe un 304 sin que se renderice nada.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.text import slugify
+
+from .catalog_cache import get_version, last_changed, make_key
+from .models import Product, Category
+
+PAGE_TIMEOUT = 60 * 10
+
+
+def is_shared_request(request):
+    """True si la respuesta es la misma para cualquier visitante anónimo"""
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    # Un mensaje pendiente solo debe verlo este visitante
+    return not len(messages.get_messages(request))
+
+
+def page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return make_key('page', path)
+
+
+def anonymous_page_cache(view):
+    """
+    Sirve la vista desde cache para GETs anónimos. Durante el render que llena
+    el cache, request.page_cache es True y los templates dejan afuera lo que
+    depende de la sesión.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_shared_request(request):
+            return view(request, *args, **kwargs)
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        request.page_cache = True
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            # Solo el cuerpo: las cookies y cabeceras de sesión son de este visitante
+            cache.set(key, (response.content, response['Content-Type']), PAGE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag de las páginas compartidas; sin consultas a la base"""
+    if not is_shared_request(request):
+        return None
+    return f'catalog-{get_version()}'
+
+
+def _last_modified(key_parts, compute):
+    # Cacheado por versión del catálogo: solo la primera revalidación consulta la base
+    key = make_key('last_modified', *key_parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute() or ''
+        cache.set(key, value, PAGE_TIMEOUT)
+    return value or None
+
+
+def _subtree_last_modified(category):
+    if category is None:
+        return None
+    products = Product.objects.filter(category.subtree_q('category__')).aggregate(last=Max('updated_at'))['last']
+    # Borrar un producto o moverlo a otra categoría no avanza ningún updated_at
+    # del subárbol; la hora del último cambio del catálogo sí
+    return max(filter(None, [category.updated_at, products, last_changed()]), default=None)
+
+
+def product_last_modified(request, pk):
+    if not is_shared_request(request):
+        return None
+
+    def compute():
+        row = Product.objects.filter(pk=pk).values_list('updated_at', 'category__updated_at').first()
+        if row is None:
+            return None
+        # Las recomendaciones y el navbar de la página cambian con bump_version
+        # aunque este producto y su categoría no se hayan tocado
+        return max(filter(None, [*row, last_changed()]), default=None)
+    return _last_modified(('product', pk), compute)
+
+
+def category_last_modified(request, foo):
+    if not is_shared_request(request):
+        return None
+
+    def compute():
+        return _subtree_last_modified(Category.objects.filter(parent=None, slug=slugify(foo)).first())
+    return _last_modified(('category', slugify(foo)), compute)
+
+
+def subcategory_last_modified(request, parent_slug, subcategory_slug):
+    if not is_shared_request(request):
+        return None
+
+    def compute():
+        return _subtree_last_modified(Category.objects.filter(
+            slug=slugify(subcategory_slug), parent__slug=slugify(parent_slug), parent__parent=None,
+        ).first())
+    return _last_modified(('subcategory', slugify(parent_slug), slugify(subcategory_slug)), compute)
+
@@ -0,0 +1,78 @@
+"""
+Paginación por cursor (keyset) para los listados del catálogo
+
+Los productos se ordenan por id descendente (los más nuevos primero) y cada
+página continúa desde el último id de la anterior con "id < cursor". A
+diferencia de OFFSET, la base no recorre ni descarta las filas de las
+páginas previas, así que la página 100 cuesta lo mismo que la primera.
+"""
+from django.urls import reverse
+
+PAGE_SIZE = 24
+CURSOR_PARAM = 'after'
+
+
+def parse_cursor(request):
+    """Lee el cursor de la URL; un valor inválido vuelve a la primera página"""
+    try:
+        cursor = int(request.GET.get(CURSOR_PARAM, ''))
+    except ValueError:
+        return None
+    return cursor if cursor > 0 else None
+
+
+class KeysetPage:
+    """Una página de resultados y el cursor para pedir la siguiente"""
+
+    def __init__(self, items, next_cursor, params):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def next_query(self):
+        """Query string de la página siguiente, conservando los demás parámetros"""
+        params = self.params.copy()
+        params[CURSOR_PARAM] = self.next_cursor
+        return params.urlencode()
+
+
+def keyset_paginate(request, queryset, per_page=PAGE_SIZE):
+    """
+    Devuelve la página pedida en request (?after=<id>) del queryset.
+    Se trae un elemento de más para saber si hay página siguiente sin COUNT.
+    """
+    queryset = queryset.order_by('-id')
+    cursor = parse_cursor(request)
+    if cursor:
+        queryset = queryset.filter(id__lt=cursor)
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = items[-1].id
+    return KeysetPage(items, next_cursor, request.GET)
+
+
+def serialize_product(product):
+    """Datos de un producto para las respuestas JSON de "cargar más" """
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': str(product.price),
+        'sale_price': str(product.sale_price),
+        'is_sale': product.is_sale,
+        'in_stock': product.is_in_stock,
+        'image': product.get_primary_image(),
+        'url': reverse('product', args=[product.id]),
+    }
@@ -0,0 +1,41 @@
+"""
+Precio efectivo de los productos
+
+Regla única de precios ("sale_price si está en oferta, si no price") en sus
+dos formas: la expresión SQL para anotar querysets (Product.objects
+.with_effective_price()) y el equivalente en Python para instancias sueltas.
+El total del carrito (y de los pedidos) sale de la anotación, en
+cart.CartSnapshot. Para filtrar por rango está effective_price_range_q, la
+misma regla escrita sobre las columnas para que la base use los índices de
+precio (un WHERE sobre el Case/When no puede usarlos). Una promoción nueva se agrega acá y vale igual en
+listados, carrito y pedidos.
+"""
+from django.db.models import Case, DecimalField, F, Q, When
+
+PRICE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def effective_price_expression(prefix=''):
+    """Case/When del precio efectivo; prefix permite usarlo desde otra tabla ('product__')"""
+    return Case(
+        When(**{f'{prefix}is_sale': True}, then=F(f'{prefix}sale_price')),
+        default=F(f'{prefix}price'),
+        output_field=PRICE_FIELD,
+    )
+
+
+def effective_price_range_q(low=None, high=None, prefix=''):
+    """Productos con precio efectivo en [low, high); equivale a filtrar la anotación"""
+    price, sale_price = Q(), Q()
+    if low is not None:
+        price &= Q(**{f'{prefix}price__gte': low})
+        sale_price &= Q(**{f'{prefix}sale_price__gte': low})
+    if high is not None:
+        price &= Q(**{f'{prefix}price__lt': high})
+        sale_price &= Q(**{f'{prefix}sale_price__lt': high})
+    return (Q(**{f'{prefix}is_sale': False}) & price) | (Q(**{f'{prefix}is_sale': True}) & sale_price)
+
+
+def effective_price(product):
+    """Precio efectivo de una instancia (mismo criterio que effective_price_expression)"""
+    return product.sale_price if product.is_sale else product.price
@@ -0,0 +1,108 @@
+"""
+Recomendaciones "comprados juntos" calculadas fuera de línea
+
+El comando build_recommendations recorre los OrderItem agrupados por pedido y
+suma a la matriz dispersa de co-ocurrencias (ProductCooccurrence) cada par de
+productos distintos del mismo pedido. Es incremental: solo procesa los pedidos
+posteriores al último RecommendationRun, y de esos solo los que tienen más de
+GRACE_PERIOD, así un pedido cuyos ítems todavía se están guardando no queda
+atrás del corte. La página de detalle lee los vecinos más frecuentes con una
+consulta sobre el índice (product, -count).
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .catalog_cache import bump_version
+from .models import ProductCooccurrence, RecommendationRun
+
+RELATED_LIMIT = 4
+BATCH_SIZE = 500
+# Los pedidos más nuevos quedan para la próxima corrida: sus ítems pueden estar
+# guardándose todavía (checkouts concurrentes) y el corte por id los saltearía
+GRACE_PERIOD = timedelta(minutes=10)
+
+
+def frequently_bought_together(product, limit=RELATED_LIMIT):
+    """Productos disponibles que más veces se compraron junto con product"""
+    pairs = (
+        ProductCooccurrence.objects
+        .filter(product=product, related__is_available=True)
+        .select_related('related')
+        .order_by('-count', 'related_id')[:limit]
+    )
+    return [pair.related for pair in pairs]
+
+
+def count_pairs(rows):
+    """
+    Matriz dispersa {producto: Counter(vecino: pedidos)} a partir de filas
+    (order_id, product_id) ordenadas por pedido.
+    """
+    matrix = defaultdict(Counter)
+    orders = 0
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        products = sorted({product_id for _, product_id in items})
+        orders += 1
+        for a, b in combinations(products, 2):
+            matrix[a][b] += 1
+            matrix[b][a] += 1
+    return matrix, orders
+
+
+def merge_counts(matrix):
+    """Suma la matriz a las co-ocurrencias guardadas con un update y un insert masivos"""
+    existing = {
+        (pair.product_id, pair.related_id): pair
+        for pair in ProductCooccurrence.objects.filter(product_id__in=list(matrix))
+    }
+    changed, created = [], []
+    for product_id, neighbours in matrix.items():
+        for related_id, count in neighbours.items():
+            pair = existing.get((product_id, related_id))
+            if pair:
+                pair.count += count
+                changed.append(pair)
+            else:
+                created.append(ProductCooccurrence(product_id=product_id, related_id=related_id, count=count))
+    ProductCooccurrence.objects.bulk_update(changed, ['count'], batch_size=BATCH_SIZE)
+    ProductCooccurrence.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    return len(changed) + len(created)
+
+
+def update_recommendations(rebuild=False):
+    """
+    Procesa los pedidos nuevos desde la última corrida (o todos con rebuild).
+    Devuelve el RecommendationRun creado, o None si no había pedidos nuevos.
+    """
+    from payment.models import Order, OrderItem
+
+    with transaction.atomic():
+        if rebuild:
+            ProductCooccurrence.objects.all().delete()
+            RecommendationRun.objects.all().delete()
+        last = RecommendationRun.objects.first()
+        since = last.last_order_id if last else 0
+        items = OrderItem.objects.filter(order_id__gt=since, product__isnull=False)
+        # El corte queda antes del primer pedido reciente, aunque haya otros más
+        # viejos con id mayor: los ids no siempre siguen el orden de los commits
+        recent = Order.objects.filter(
+            id__gt=since, date_ordered__gte=timezone.now() - GRACE_PERIOD
+        ).aggregate(first=Min('id'))['first']
+        if recent is not None:
+            items = items.filter(order_id__lt=recent)
+        until = items.aggregate(last=Max('order_id'))['last']
+        if until is None:
+            return None
+        rows = items.filter(order_id__lte=until).order_by('order_id').values_list('order_id', 'product_id')
+        matrix, orders = count_pairs(rows.iterator(chunk_size=2000))
+        pairs = merge_counts(matrix)
+        run = RecommendationRun.objects.create(last_order_id=until, orders=orders)
+    if pairs:
+        # Las páginas de detalle cacheadas muestran las recomendaciones
+        bump_version()
+    return run
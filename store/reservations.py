@@ -5,8 +5,8 @@ from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from cart.cart import Cart
-from store.models import Product, Profile, Reservation
+from cart.cart import get_cart, forget_saved_cart
+from store.models import Product, Reservation
 from payment.models import ShippingAddress
 import datetime
 from datetime import timedelta
@@ -18,7 +18,7 @@ def create_reservation(request):
     """
     if request.method == 'POST':
         # Obtener el carrito
-        cart = Cart(request)
+        cart = get_cart(request)
         cart_products = cart.get_prods()
         quantities = cart.get_quants()
         totals = cart.cart_total()
@@ -32,7 +32,7 @@ def create_reservation(request):
         # Validar stock para todos los productos
         stock_errors = []
         for product in cart_products:
-            quantity = quantities().get(str(product.id), 0)
+            quantity = quantities.get(str(product.id), 0)
             if not product.is_in_stock:
                 stock_errors.append(f"{product.name} no está disponible")
             elif product.stock < quantity:
@@ -47,13 +47,10 @@ def create_reservation(request):
         reservations_created = []
         try:
             for product in cart_products:
-                quantity = quantities().get(str(product.id), 0)
+                quantity = quantities.get(str(product.id), 0)
                 
                 # Calcular precio
-                if product.is_sale:
-                    unit_price = product.sale_price
-                else:
-                    unit_price = product.price
+                unit_price = product.get_effective_price()
                 
                 total_price = unit_price * quantity
                 
@@ -196,12 +193,7 @@ def clear_cart(request):
             del request.session[key]
     
     # Limpiar carrito en BD para usuarios autenticados
-    if request.user.is_authenticated:
-        try:
-            current_user = Profile.objects.filter(user__id=request.user.id)
-            current_user.update(old_cart="")
-        except:
-            pass
+    forget_saved_cart(request.user)
 
 
 def reservation_detail(request, reservation_id):
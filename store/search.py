@@ -0,0 +1,276 @@
+"""
+Índice full-text de productos
+
+En SQLite se usa una tabla virtual FTS5 y en PostgreSQL una tabla con una
+columna tsvector indexada con GIN. El índice cubre nombre, descripción y
+nombre de categoría, y se mantiene al día con las señales de Product y
+Category, así que una búsqueda nunca recorre la tabla de productos.
+
+Cuando el índice full-text no encuentra nada (errores de tipeo como
+"revolvr"), se busca por similitud de trigramas sobre los nombres
+normalizados, usando la tabla ProductTrigram.
+"""
+import math
+import re
+
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Case, When, Q, Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category, ProductTrigram
+from .utils import normalize_text
+
+FTS_TABLE = 'store_product_fts'
+
+# Cantidad máxima de resultados que devuelve el índice
+MAX_RESULTS = 200
+
+# Pesos de relevancia: nombre > categoría > descripción
+SQLITE_WEIGHTS = (10.0, 2.0, 5.0)  # (name, description, category)
+
+# Fracción mínima de trigramas de la consulta que debe tener un nombre
+SIMILARITY_THRESHOLD = 0.5
+
+
+def is_supported(conn=None):
+    """Indica si el motor de base de datos tiene índice full-text"""
+    conn = conn or connection
+    return conn.vendor in ('sqlite', 'postgresql')
+
+
+def create_index(conn=None):
+    """Crea la tabla del índice si no existe"""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                'USING fts5(name, description, category, tokenize = "unicode61 remove_diacritics 2")'
+            )
+        elif conn.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {FTS_TABLE} ('
+                'product_id bigint PRIMARY KEY REFERENCES store_product(id) ON DELETE CASCADE, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {FTS_TABLE}_document_idx '
+                f'ON {FTS_TABLE} USING GIN (document)'
+            )
+
+
+def drop_index(conn=None):
+    """Elimina la tabla del índice"""
+    conn = conn or connection
+    if is_supported(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _document(name, description, category_name):
+    """Texto normalizado (sin acentos, en minúsculas) que se indexa"""
+    return (
+        normalize_text(name or ''),
+        normalize_text(description or ''),
+        normalize_text(category_name or ''),
+    )
+
+
+def write_rows(rows, conn=None):
+    """
+    Inserta o reemplaza filas del índice.
+    rows: iterable de (product_id, name, description, category_name)
+    """
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    params = [(pk,) + _document(name, description, category) for pk, name, description, category in rows]
+    if not params:
+        return
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(p[0],) for p in params])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                params,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'B')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params,
+            )
+
+
+def delete_rows(product_ids, conn=None):
+    """Quita productos del índice"""
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    column = 'rowid' if conn.vendor == 'sqlite' else 'product_id'
+    with conn.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE {column} = %s', [(pk,) for pk in product_ids])
+
+
+def index_products(queryset):
+    """Reindexa los productos del queryset"""
+    rows = queryset.values_list('id', 'name', 'description', 'category__name')
+    write_rows(rows.iterator())
+
+
+@transaction.atomic
+def rebuild_index():
+    """Reconstruye el índice completo a partir de la tabla de productos"""
+    drop_index()
+    create_index()
+    index_products(Product.objects.all())
+    ProductTrigram.objects.all().delete()
+    write_trigrams(Product.objects.values_list('id', 'name').iterator())
+
+
+def trigrams(text):
+    """
+    Trigramas de un texto normalizado, al estilo de pg_trgm: cada palabra se
+    rellena con dos espacios al inicio y uno al final.
+    trigrams('Óptica') -> {'  o', ' op', 'opt', 'pti', 'tic', 'ica', 'ca '}
+    """
+    grams = set()
+    for word in re.findall(r'\w+', normalize_text(text)):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def write_trigrams(rows, conn=None):
+    """
+    Inserta los trigramas de los nombres dados.
+    rows: iterable de (product_id, name)
+    Se usa executemany en lugar de bulk_create: una reconstrucción completa
+    inserta más de un millón de filas y así tarda varias veces menos.
+    """
+    conn = conn or connection
+    params = [(pk, gram) for pk, name in rows for gram in trigrams(name or '')]
+    if not params:
+        return
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {ProductTrigram._meta.db_table} (product_id, trigram) VALUES (%s, %s)',
+            params,
+        )
+
+
+def index_trigrams(product):
+    """Regenera los trigramas de un producto"""
+    with transaction.atomic():
+        ProductTrigram.objects.filter(product=product).delete()
+        write_trigrams([(product.pk, product.name)])
+
+
+def fuzzy_search_products(query, limit=MAX_RESULTS):
+    """
+    Busca productos cuyo nombre comparte la mayor parte de los trigramas de
+    la consulta. Se resuelve con una sola consulta agrupada sobre el índice
+    (trigram, product), sin comparar fila por fila en Python.
+    """
+    grams = trigrams(query)
+    if not grams:
+        return Product.objects.none()
+    min_hits = max(1, math.ceil(len(grams) * SIMILARITY_THRESHOLD))
+    matches = (
+        ProductTrigram.objects.filter(trigram__in=grams)
+        .values('product')
+        .annotate(hits=Count('id'))
+        .filter(hits__gte=min_hits)
+        .order_by('-hits', 'product')[:limit]
+    )
+    ids = [row['product'] for row in matches]
+    if not ids:
+        return Product.objects.none()
+    ranking = Case(*[When(id=pk, then=position) for position, pk in enumerate(ids)])
+    return Product.objects.filter(id__in=ids).select_related('category').order_by(ranking)
+
+
+def _tokens(query):
+    return re.findall(r'\w+', normalize_text(query))
+
+
+def _match_expression(tokens, vendor):
+    """Arma la consulta del motor: todos los términos, con coincidencia por prefijo"""
+    if vendor == 'sqlite':
+        return ' '.join(f'"{token}"*' for token in tokens)
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def _ranked_ids(tokens, limit):
+    match = _match_expression(tokens, connection.vendor)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [match, limit],
+            )
+        else:
+            cursor.execute(
+                f"SELECT product_id FROM {FTS_TABLE} WHERE document @@ to_tsquery('simple', %s) "
+                f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s",
+                [match, match, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_products(query, limit=MAX_RESULTS):
+    """
+    Busca productos por nombre, descripción y categoría.
+    Devuelve un queryset ordenado por relevancia; si no hay coincidencias
+    exactas se intenta una búsqueda aproximada por trigramas.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return Product.objects.none()
+
+    if is_supported():
+        try:
+            ids = _ranked_ids(tokens, limit)
+        except DatabaseError:
+            # El índice todavía no existe (por ejemplo, migraciones pendientes)
+            ids = None
+        if ids is not None:
+            if not ids:
+                return fuzzy_search_products(query, limit)
+            ranking = Case(*[When(id=pk, then=position) for position, pk in enumerate(ids)])
+            return Product.objects.filter(id__in=ids).select_related('category').order_by(ranking)
+
+    # Motor sin índice full-text: búsqueda simple por contenido
+    filters = Q()
+    for token in tokens:
+        filters &= Q(name__icontains=token) | Q(description__icontains=token) | Q(category__name__icontains=token)
+    products = Product.objects.filter(filters).select_related('category')[:limit]
+    return products if products else fuzzy_search_products(query, limit)
+
+
+# Mantener el índice actualizado
+@receiver(post_save, sender=Product)
+def update_product_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_products(Product.objects.filter(pk=instance.pk))
+    index_trigrams(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_index(sender, instance, **kwargs):
+    delete_rows([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def update_category_index(sender, instance, created=False, raw=False, **kwargs):
+    # Una categoría nueva no tiene productos todavía
+    if raw or created:
+        return
+    index_products(Product.objects.filter(category=instance))
@@ -0,0 +1,52 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 576px) 50vw, (max-width: 1200px) 33vw, 25vw'
+
+
+def _srcset(variants):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in variants)
+
+
+@register.simple_tag
+def responsive_image(item, sizes=DEFAULT_SIZES, **attrs):
+    """
+    <img> con srcset de los derivados de un Product o ProductImage:
+
+        {% responsive_image product class="card-img-top" alt=product.name %}
+
+    Con derivados genera un <picture> con la fuente WebP y el formato de
+    respaldo. Mientras el worker los genera muestra un placeholder, y para
+    imágenes anteriores al pipeline usa el original. Si la imagen principal
+    del producto es una de la galería, usa la copia de su manifiesto guardada
+    en el producto (primary_image_derivatives), sin consultar la galería.
+    """
+    attrs.setdefault('loading', 'lazy')
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    # En los productos se muestra la imagen principal desnormalizada
+    image = getattr(item, 'primary_image', None) or item.image
+    manifest = item.image_derivatives or {}
+    if image.name != item.image.name:
+        manifest = item.primary_image_derivatives or {}
+        if manifest.get('source') != image.name:
+            # Copia de otra versión de la imagen: mejor el original que derivados ajenos
+            manifest = {}
+    if manifest.get('pending'):
+        return format_html('<img src="{}"{}>', static('assets/product-placeholder.svg'), extra)
+    if not manifest.get('variants'):
+        return format_html('<img src="{}"{}>', image.url, extra)
+    webp = manifest['variants']['webp']
+    fallback = manifest['variants'][manifest['fallback']]
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{}>'
+        '</picture>',
+        _srcset(webp), sizes,
+        default_storage.url(fallback[-1][1]), _srcset(fallback), sizes,
+        manifest['width'], manifest['height'], extra,
+    )
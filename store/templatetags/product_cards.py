@@ -0,0 +1,60 @@
+from django import template
+from django.core.cache import cache
+
+register = template.Library()
+
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(fragment, product):
+    """Clave de la tarjeta: cambia sola cuando se guarda el producto o sus imágenes"""
+    return f'card:{fragment}:{product.id}:{product.cache_version}'
+
+
+class ProductCardsNode(template.Node):
+    def __init__(self, fragment, products, nodelist):
+        self.fragment = fragment
+        self.products = products
+        self.nodelist = nodelist
+
+    def render(self, context):
+        fragment = self.fragment.resolve(context)
+        products = list(self.products.resolve(context) or [])
+        keys = [card_key(fragment, product) for product in products]
+        # Una sola ida al cache para todo el listado solo en backends que agrupan
+        # (Redis, Memcached; en la tabla de la base get_many es un SELECT); en los
+        # demás get_many/set_many hacen un get/set por clave
+        cached = cache.get_many(keys)
+        rendered = {}
+        parts = []
+        for key, product in zip(keys, products):
+            html = cached.get(key)
+            if html is None:
+                with context.push(product=product):
+                    html = self.nodelist.render(context)
+                rendered[key] = html
+            parts.append(html)
+        if rendered:
+            # Igual que get_many: un viaje en Redis/Memcached. DatabaseCache escribe
+            # clave por clave, pero solo las tarjetas que faltaban
+            cache.set_many(rendered, CARD_TIMEOUT)
+        return ''.join(parts)
+
+
+@register.tag
+def product_cards(parser, token):
+    """
+    Renderiza la tarjeta de cada producto del listado, cacheada por producto:
+
+        {% product_cards 'home' products %}
+            ... markup de la tarjeta usando {{ product }} ...
+        {% endproduct_cards %}
+
+    El primer argumento distingue las tarjetas de cada página.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' recibe un nombre de fragmento y la lista de productos")
+    nodelist = parser.parse(('endproduct_cards',))
+    parser.delete_first_token()
+    return ProductCardsNode(parser.compile_filter(bits[1]), parser.compile_filter(bits[2]), nodelist)
@@ -0,0 +1,50 @@
+"""
+Base común de los tests
+
+Los tests no usan el cache configurado en settings: con Redis o la tabla de la
+base, cache.clear() borraría el cache del sitio. Cada clase corre sobre un
+LocMemCache propio que se vacía antes de cada test. Para simular otro proceso
+basta con caches.create_connection('default'), que comparte ese almacenamiento
+pero no el estado que cada módulo guarda en memoria.
+
+TemporaryMediaMixin lleva MEDIA_ROOT a un directorio temporal por test, así
+las imágenes subidas y sus derivados no quedan en media/.
+"""
+import io
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StoreTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class TemporaryMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size=(1200, 800)):
+        """JPEG de prueba listo para asignar a un ImageField"""
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (120, 40, 40)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
@@ -1,12 +1,45 @@
-from django.test import TestCase, Client
-from .models import Product, Order, Profile, Category, Customer, Reservation
+from django.test import Client
+from .models import Product, Order, Profile, Category, Customer, Reservation, ProductImage
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db.models import Q
+import io
+import datetime
+import os
+import time
+from datetime import timedelta
+from unittest import mock
 
-class OrderCreationTest(TestCase):
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection, models as db_models
+from django.db.models.signals import post_save
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cart.cart import CartSnapshot
+from payment.models import Order as PaymentOrder, OrderItem
+from . import autocomplete, images
+from .autocomplete import PrefixIndex, suggest
+from .catalog_cache import get_version, VERSION_KEY
+from .context_processors import categories, get_parent_categories, invalidate
+from .facets import apply_filters, build_facets
+from .images import save_derivatives
+from .models import ImageTask, ProductCooccurrence, VisitCounter
+from .pricing import effective_price
+from .recommendations import frequently_bought_together, update_recommendations
+from .search import search_products
+from .testing import StoreTestCase, TemporaryMediaMixin
+
+
+class OrderCreationTest(StoreTestCase):
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create_user(username='testuser', password='testpass', email='test@mail.com')
         self.category = Category.objects.create(name='Test Category')
         self.product = Product.objects.create(name='Test Product', price=100, category=self.category)
@@ -28,8 +61,9 @@ class OrderCreationTest(TestCase):
         # Verifica que se haya creado una orden
         self.assertTrue(Order.objects.filter(product=self.product, customer=self.customer, address='Test Address', phone='123456789').exists())
 
-class SearchFunctionalityTest(TestCase):
+class SearchFunctionalityTest(StoreTestCase):
     def setUp(self):
+        super().setUp()
         # Crear categorías de prueba
         self.armas_category = Category.objects.create(name='Armas')
         self.municiones_category = Category.objects.create(name='Municiones')
@@ -97,8 +131,9 @@ class SearchFunctionalityTest(TestCase):
         self.assertContains(response, 'Por favor ingresa un término de búsqueda')
 
 
-class ProductImageDisplayTest(TestCase):
+class ProductImageDisplayTest(StoreTestCase):
     def setUp(self):
+        super().setUp()
         self.category = Category.objects.create(name='Test Category')
         self.product = Product.objects.create(
             name='Test Product',
@@ -127,8 +162,9 @@ class ProductImageDisplayTest(TestCase):
         self.assertContains(response, 'Buscar Productos')
 
 
-class ReservationTest(TestCase):
+class ReservationTest(StoreTestCase):
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create_user(
             username='testuser', 
             password='testpass', 
@@ -166,3 +202,728 @@ class ReservationTest(TestCase):
         with self.assertRaises(ValueError):
             if self.product.stock < 10:  # El producto solo tiene 5 en stock
                 raise ValueError("Stock insuficiente")
+
+
+class FullTextSearchIndexTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Ópticas')
+        self.rifle = Product.objects.create(
+            name='Rifle Bolt Action', description='Culata de nogal', price=1000, category=self.category)
+        self.mira = Product.objects.create(
+            name='Mira telescópica 4x', description='Ideal para rifle de caza', price=200, category=self.category)
+
+    def test_ranked_by_relevance(self):
+        """Un término en el nombre pesa más que en la descripción"""
+        results = list(search_products('rifle'))
+        self.assertEqual(results, [self.rifle, self.mira])
+
+    def test_matches_description_and_category_without_accents(self):
+        self.assertEqual(list(search_products('nogal')), [self.rifle])
+        self.assertEqual(len(search_products('opticas')), 2)
+
+    def test_index_follows_product_and_category_changes(self):
+        self.mira.name = 'Visor nocturno'
+        self.mira.description = ''
+        self.mira.save()
+        self.assertEqual(list(search_products('visor')), [self.mira])
+        self.category.name = 'Accesorios'
+        self.category.save()
+        self.assertEqual(len(search_products('accesorios')), 2)
+        self.rifle.delete()
+        self.assertEqual(list(search_products('nogal')), [])
+
+    def test_search_view_uses_index(self):
+        response = self.client.get(reverse('search'), {'q': 'telescopica'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['searched']), [self.mira])
+
+    def test_typo_falls_back_to_trigram_similarity(self):
+        self.assertEqual(list(search_products('telescpica')), [self.mira])
+        self.assertEqual(list(search_products('rifel bolt')), [self.rifle])
+        self.assertEqual(list(search_products('zzzz')), [])
+
+
+class AutocompleteTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete.invalidate()
+        self.category = Category.objects.create(name='Ópticas')
+        self.product = Product.objects.create(name='Mira óptica 4x32', price=100, category=self.category)
+
+    def test_suggests_categories_first_and_matches_any_word(self):
+        response = self.client.get(reverse('autocomplete'), {'q': 'opti'})
+        names = [s['name'] for s in response.json()['suggestions']]
+        self.assertEqual(names, ['Ópticas', 'Mira óptica 4x32'])
+        self.assertEqual(response.json()['suggestions'][1]['url'], reverse('product', args=[self.product.id]))
+
+    def test_answers_from_memory_and_invalidates_on_save(self):
+        suggest('mira')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(suggest('mira')), 1)
+        self.product.name = 'Visor nocturno'
+        self.product.save()
+        self.assertEqual(suggest('mira'), [])
+        self.assertEqual(suggest('visor')[0]['name'], 'Visor nocturno')
+
+    def test_categories_later_in_the_index_are_not_cut_off(self):
+        entries = [(f'Optica {n:02d}', 'product', f'/p/{n}') for n in range(20)]
+        entries.append(('Optiz', 'category', '/c/optiz'))
+        self.assertEqual(PrefixIndex(entries).lookup('opti', limit=2)[0]['name'], 'Optiz')
+
+    def test_rebuilt_when_another_process_bumps_the_version(self):
+        suggest('mira')
+        Product.objects.filter(pk=self.product.pk).update(name='Visor nocturno')
+        other_process = caches.create_connection('default')
+        other_process.set(VERSION_KEY, get_version() + 1, None)
+        self.assertEqual(suggest('mira'), [])
+
+
+class KeysetPaginationTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Accesorios')
+        self.products = [
+            Product.objects.create(name=f'Producto {i}', price=10, category=self.category) for i in range(30)
+        ]
+
+    def test_pages_follow_cursor_without_offset(self):
+        first = self.client.get(reverse('home'))
+        page = first.context['page']
+        self.assertEqual(len(page), 24)
+        self.assertTrue(page.has_next)
+        self.assertContains(first, f'?after={page.next_cursor}')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(reverse('home'), {'after': page.next_cursor})
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+        rest = second.context['page']
+        self.assertEqual(len(rest), 6)
+        self.assertFalse(rest.has_next)
+        seen = {p.id for p in page} | {p.id for p in rest}
+        self.assertEqual(seen, {p.id for p in self.products})
+
+    def test_json_load_more(self):
+        response = self.client.get(reverse('products_ajax'), {'category': self.category.id})
+        data = response.json()
+        self.assertEqual(len(data['products']), 24)
+        self.assertEqual(data['products'][0]['id'], self.products[-1].id)
+        data = self.client.get(reverse('products_ajax'), {'category': self.category.id, 'after': data['next_cursor']}).json()
+        self.assertEqual(len(data['products']), 6)
+        self.assertIsNone(data['next_cursor'])
+
+
+class CategoryFacetsTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Accesorios')
+        self.fundas = Category.objects.create(name='Fundas', parent=self.category)
+        Product.objects.create(name='Funda', price=30000, stock=2, category=self.fundas)
+        Product.objects.create(name='Correa', price=80000, stock=0, is_sale=True, sale_price=70000, category=self.category)
+        Product.objects.create(name='Bipode', price=250000, stock=5, is_sale=True, sale_price=200000, category=self.category)
+
+    def test_counts_come_from_one_aggregate_and_are_cached(self):
+        products = self.category.get_all_products()
+        with self.assertNumQueries(1):
+            facets = build_facets(self.category, products, QueryDict(), [self.fundas])
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['in_stock']['count'], 2)
+        self.assertEqual(facets['on_sale']['count'], 2)
+        self.assertEqual([o['count'] for o in facets['price']], [1, 1, 1, 0])
+        self.assertEqual(facets['subcategories'][0]['count'], 1)
+        with self.assertNumQueries(0):
+            build_facets(self.category, products, QueryDict(), [self.fundas])
+
+    def test_counts_respect_the_other_active_filters(self):
+        products = self.category.get_all_products()
+        params = QueryDict('in_stock=1')
+        facets = build_facets(self.category, products, params, [self.fundas])
+        self.assertEqual(facets['total'], 2)
+        # Cada opción cuenta lo que devuelve elegirla junto con los demás filtros
+        self.assertEqual(facets['on_sale']['count'], 1)
+        self.assertEqual([o['count'] for o in facets['price']], [1, 0, 1, 0])
+        self.assertEqual(facets['in_stock']['count'], 2)
+        combined = QueryDict('in_stock=1&on_sale=1')
+        self.assertEqual(apply_filters(products, combined).count(), facets['on_sale']['count'])
+        facets = build_facets(self.category, products, QueryDict('price=50000-200000'), [self.fundas])
+        self.assertEqual([o['count'] for o in facets['price']], [1, 1, 1, 0])
+        self.assertEqual(facets['in_stock']['count'], 0)
+        self.assertEqual(facets['subcategories'][0]['count'], 0)
+
+    def test_filters_combine_on_category_page(self):
+        url = reverse('category', args=['accesorios'])
+        response = self.client.get(url, {'in_stock': '1', 'on_sale': '1'})
+        self.assertEqual([p.name for p in response.context['products']], ['Bipode'])
+        response = self.client.get(url, {'sub': self.fundas.id})
+        self.assertEqual([p.name for p in response.context['products']], ['Funda'])
+        self.assertTrue(response.context['facets']['subcategories'][0]['active'])
+
+
+class CategorySlugTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Cuchillería Táctica')
+        self.sub = Category.objects.create(name='Navajas', parent=self.category)
+
+    def test_slug_synced_and_used_for_lookup(self):
+        self.assertEqual(self.category.slug, 'cuchilleria-tactica')
+        self.assertEqual(self.sub.get_absolute_url(), reverse('subcategory', args=['cuchilleria-tactica', 'navajas']))
+        self.category.name = 'Cuchillos'
+        self.category.save(update_fields=['name'])
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.slug, 'cuchillos')
+        response = self.client.get(reverse('subcategory', args=['cuchillos', 'navajas']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['subcategory'], self.sub)
+
+    def test_legacy_urls_redirect_to_canonical(self):
+        response = self.client.get(reverse('category', args=['Cuchillería Táctica']))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('category', args=['cuchilleria']))
+        self.assertRedirects(response, reverse('category', args=['cuchilleria-tactica']), status_code=301)
+        response = self.client.get(reverse('category', args=['no-existe']))
+        self.assertRedirects(response, reverse('home'))
+
+    def test_colliding_slug_deduplicated_and_kept_on_save(self):
+        first = Category.objects.create(name='Ópticas')
+        second = Category.objects.create(name='Opticas')
+        self.assertEqual(first.slug, 'opticas')
+        self.assertEqual(second.slug, f'opticas-{second.id}')
+        second.description = 'Miras y visores'
+        second.save()
+        second.refresh_from_db()
+        self.assertEqual(second.slug, f'opticas-{second.id}')
+        first.name = 'Miras'
+        first.save()
+        self.assertEqual(first.slug, 'miras')
+        second.name = 'Visores'
+        second.save()
+        self.assertEqual(second.slug, 'visores')
+
+
+class CategoryTreeTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.armas = Category.objects.create(name='Armas')
+        self.cortas = Category.objects.create(name='Cortas', parent=self.armas)
+        self.pistolas = Category.objects.create(name='Pistolas', parent=self.cortas)
+        self.otra = Category.objects.create(name='Otra')
+        self.p1 = Product.objects.create(name='Glock', price=100, category=self.pistolas)
+        self.p2 = Product.objects.create(name='Revolver', price=100, category=self.cortas)
+
+    def test_products_at_any_depth_in_one_query(self):
+        self.assertEqual(self.pistolas.path, f'{self.armas.id}/{self.cortas.id}/{self.pistolas.id}/')
+        with self.assertNumQueries(1):
+            names = sorted(p.name for p in self.armas.get_all_products())
+        self.assertEqual(names, ['Glock', 'Revolver'])
+        self.assertEqual(list(self.otra.get_all_products()), [])
+
+    def test_moving_a_subtree_rewrites_only_its_paths(self):
+        self.cortas.parent = self.otra
+        self.cortas.save()
+        self.pistolas.refresh_from_db()
+        self.assertEqual(self.pistolas.path, f'{self.otra.id}/{self.cortas.id}/{self.pistolas.id}/')
+        self.assertEqual(self.otra.get_all_products().count(), 2)
+        self.assertEqual(self.armas.get_all_products().count(), 0)
+        self.assertEqual(list(self.otra.get_descendants()), [self.cortas, self.pistolas])
+        self.otra.parent = self.pistolas
+        with self.assertRaises(ValueError):
+            self.otra.save()
+
+    def test_post_save_sees_moved_descendants_and_failures_roll_back(self):
+        seen = []
+
+        def record(sender, instance, **kwargs):
+            seen.append(Category.objects.get(pk=self.pistolas.pk).path)
+        post_save.connect(record, sender=Category)
+        self.addCleanup(post_save.disconnect, record, sender=Category)
+        self.cortas.parent = self.otra
+        self.cortas.save()
+        self.assertEqual(seen, [f'{self.otra.id}/{self.cortas.id}/{self.pistolas.id}/'])
+
+        self.cortas.parent = self.armas
+        with mock.patch.object(db_models.Model, 'save', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.cortas.save()
+        self.pistolas.refresh_from_db()
+        self.assertEqual(self.pistolas.path, f'{self.otra.id}/{self.cortas.id}/{self.pistolas.id}/')
+
+
+class CategoriesApiTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.armas = Category.objects.create(name='Armas')
+        self.cortas = Category.objects.create(name='Cortas', parent=self.armas)
+        self.pistolas = Category.objects.create(name='Pistolas', parent=self.cortas)
+        Product.objects.create(name='Glock', price=100, category=self.pistolas)
+        Product.objects.create(name='Revolver', price=100, category=self.cortas)
+        Product.objects.create(name='Rifle', price=100, category=self.armas)
+
+    def test_tree_counts_in_two_queries_then_cached_with_etag(self):
+        url = reverse('categories_ajax')
+        # Solo las consultas al catálogo (el contador de visitas hace las suyas)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        catalog = [q for q in queries if 'store_product' in q['sql'] or 'store_category' in q['sql']]
+        self.assertEqual(len(catalog), 2)
+        armas = response.json()['categories'][0]
+        self.assertEqual(armas['product_count'], 3)
+        self.assertEqual(armas['subcategories'][0]['product_count'], 2)
+        self.assertEqual(armas['subcategories'][0]['subcategories'][0]['product_count'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertFalse([q for q in queries if 'store_product' in q['sql'] or 'store_category' in q['sql']])
+        self.assertEqual(response.status_code, 304)
+        etag = response['ETag']
+        Product.objects.create(name='Bersa', price=100, category=self.pistolas)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['categories'][0]['product_count'], 4)
+
+
+class NavbarCategoriesTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        invalidate()
+        Category.objects.create(name='Municiones')
+
+    def test_lazy_and_cached_until_categories_change(self):
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(0):
+            context = categories(request)
+        with self.assertNumQueries(1):
+            self.assertEqual([c.name for c in context['categories']], ['Municiones'])
+        with self.assertNumQueries(0):
+            list(categories(request)['categories'])
+        Category.objects.create(name='Accesorios')
+        self.assertEqual([c.name for c in categories(request)['categories']], ['Accesorios', 'Municiones'])
+
+    def test_sees_version_bumped_by_another_process(self):
+        request = RequestFactory().get('/')
+        list(categories(request)['categories'])
+        # update() no dispara señales en este proceso; otro worker invalida por su cuenta
+        Category.objects.update(name='Accesorios')
+        other_process = caches.create_connection('default')
+        other_process.set(VERSION_KEY, get_version() + 1, None)
+        self.assertEqual([c.name for c in categories(request)['categories']], ['Accesorios'])
+
+
+class ProductCardCacheTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Ópticas')
+        self.products = [Product.objects.create(name=f'Mira {i}', price=100, category=category) for i in range(3)]
+
+    def render(self):
+        template = Template("{% load product_cards %}{% product_cards 'test' products %}[{{ product.name }}]{% endproduct_cards %}")
+        return template.render(Context({'products': Product.objects.order_by('id')}))
+
+    def test_cards_cached_per_product_version(self):
+        self.assertEqual(self.render(), '[Mira 0][Mira 1][Mira 2]')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.assertEqual(self.render(), '[Mira 0][Mira 1][Mira 2]')
+        self.assertEqual(get_many.call_count, 1)
+        set_many.assert_not_called()
+        self.products[1].name = 'Mira nueva'
+        self.products[1].save()
+        self.assertEqual(self.render(), '[Mira 0][Mira nueva][Mira 2]')
+
+
+class AnonymousPageCacheTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Cuchillos')
+        self.product = Product.objects.create(name='Navaja', price=100, category=self.category)
+
+    def test_anonymous_pages_served_from_cache_and_purged_on_change(self):
+        url = reverse('product', args=[self.product.id])
+        first = self.client.get(url)
+        self.assertContains(first, 'data-badge-url')
+        self.assertIsNotNone(first.context)
+        second = self.client.get(url)
+        self.assertIsNone(second.context)
+        self.assertEqual(second.content, first.content)
+        self.assertIn('csrftoken', second.cookies)
+        self.product.name = 'Navaja suiza'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Navaja suiza')
+
+    def test_purged_when_another_process_bumps_the_version(self):
+        url = reverse('product', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        # Cambio sin señales en este proceso; la invalidación llega desde otro, como un comando
+        Product.objects.filter(pk=self.product.pk).update(name='Navaja suiza')
+        self.assertNotContains(self.client.get(url), 'Navaja suiza')
+        other_process = caches.create_connection('default')
+        other_process.set(VERSION_KEY, get_version() + 1, None)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertContains(self.client.get(url), 'Navaja suiza')
+
+    def test_logged_in_users_and_cart_badge(self):
+        self.client.post(reverse('cart_add'), {'action': 'post', 'product_id': self.product.id, 'product_qty': 1})
+        self.assertEqual(self.client.get(reverse('cart_badge')).json(), {'qty': 1})
+        User.objects.create_user(username='cliente', password='clave-segura-123')
+        self.client.login(username='cliente', password='clave-segura-123')
+        response = self.client.get(reverse('home'))
+        self.assertIsNotNone(response.context)
+        self.assertNotContains(response, 'data-badge-url')
+
+    def test_json_endpoints_are_not_counted_as_visits(self):
+        self.client.get(reverse('product', args=[self.product.id]))
+        self.assertEqual(VisitCounter.objects.count(), 1)
+        self.client.get(reverse('cart_badge'))
+        self.client.get(reverse('autocomplete'), {'q': 'nav'})
+        self.client.get(reverse('products_ajax'), {'category': self.category.id})
+        self.client.get(reverse('home'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(VisitCounter.objects.count(), 1)
+
+
+class ConditionalGetTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Linternas')
+        self.product = Product.objects.create(name='Linterna', price=100, category=self.category)
+
+    def test_revalidation_returns_304_until_something_changes(self):
+        url = reverse('product', args=[self.product.id])
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        category_url = reverse('category', args=['linternas'])
+        response = self.client.get(category_url)
+        self.assertEqual(self.client.get(category_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        later = timezone.now() + datetime.timedelta(seconds=5)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.product.additional_images.create(image='uploads/product/gallery/x.jpg')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.updated_at, later)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_deleting_a_product_advances_category_last_modified(self):
+        other = Product.objects.create(name='Linterna táctica', price=100, category=self.category)
+        url = reverse('category', args=['linternas'])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        later = int((time.time() + 5) * 1000)
+        with mock.patch('store.catalog_cache._initial_version', return_value=later):
+            other.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Linterna táctica')
+
+    def test_catalog_change_advances_product_last_modified(self):
+        url = reverse('product', args=[self.product.id])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # Otro producto de la misma categoría cambia las recomendaciones de esta página
+        later = int((time.time() + 5) * 1000)
+        with mock.patch('store.catalog_cache._initial_version', return_value=later):
+            Product.objects.create(name='Linterna táctica', price=100, category=self.category)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_no_validators_for_logged_in_users(self):
+        User.objects.create_user(username='cliente', password='clave-segura-123')
+        self.client.login(username='cliente', password='clave-segura-123')
+        response = self.client.get(reverse('product', args=[self.product.id]))
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+
+class ResponsiveImageTest(TemporaryMediaMixin, StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Miras')
+
+    def test_derivatives_generated_by_worker_with_content_hash_and_srcset(self):
+        template = Template('{% load image_tags %}{% responsive_image product class="card-img-top" %}')
+        product = Product.objects.create(name='Mira', price=100, category=self.category, image=self.upload('mira.jpg'))
+        product.save()
+        # El save solo encola: una única tarea pendiente y placeholder hasta que corra el worker
+        self.assertEqual(ImageTask.objects.filter(status='pending').count(), 1)
+        product.refresh_from_db()
+        self.assertIn('product-placeholder.svg', template.render(Context({'product': product})))
+
+        call_command('process_image_tasks', '--once', '--workers', '1', stdout=io.StringIO())
+        self.assertEqual(ImageTask.objects.get().status, 'done')
+        product.refresh_from_db()
+        manifest = product.image_derivatives
+        self.assertEqual(manifest['source'], product.image.name)
+        self.assertEqual([w for w, name in manifest['variants']['webp']], [320, 640, 960])
+        for width, name in manifest['variants']['webp'] + manifest['variants']['jpg']:
+            self.assertIn(f"-{manifest['hash']}-{width}w.", name)
+            self.assertTrue(default_storage.exists(name))
+        html = template.render(Context({'product': product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-640w.webp 640w', html)
+        self.assertIn('class="card-img-top"', html)
+
+        small = ProductImage.objects.create(product=product, image=self.upload('detalle.jpg', (200, 100)))
+        call_command('process_image_tasks', '--once', '--workers', '1', stdout=io.StringIO())
+        small.refresh_from_db()
+        self.assertEqual([w for w, name in small.image_derivatives['variants']['webp']], [200])
+
+    def test_final_failure_falls_back_to_the_original(self):
+        product = Product.objects.create(name='Mira', price=100, category=self.category, image=self.upload('mira.jpg'))
+        for attempt in range(images.MAX_ATTEMPTS):
+            task, = images.claim_tasks(1)
+            images.fail_task(task, 'Imagen corrupta')
+        self.assertEqual(ImageTask.objects.get().status, 'failed')
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, {'source': product.image.name})
+        html = Template('{% load image_tags %}{% responsive_image product %}').render(Context({'product': product}))
+        self.assertIn(product.image.url, html)
+        self.assertNotIn('product-placeholder.svg', html)
+
+    def test_claimed_task_is_not_released_for_its_time_in_the_queue(self):
+        Product.objects.create(name='Mira', price=100, category=self.category, image=self.upload('mira.jpg'))
+        ImageTask.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        task, = images.claim_tasks(1)
+        self.assertEqual(images.release_stale_tasks(timedelta(minutes=10)), 0)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'running')
+
+
+class OptimizeMediaTest(TemporaryMediaMixin, StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Miras')
+
+    def test_optimize_media_is_parallel_and_skips_unchanged_files(self):
+        Product.objects.create(name='Mira 1', price=100, category=self.category, image=self.upload('mira1.jpg'))
+        second = Product.objects.create(name='Mira 2', price=100, category=self.category, image=self.upload('mira2.jpg', (2000, 1000)))
+        out = io.StringIO()
+        call_command('optimize_media', '--workers', '2', stdout=out)
+        self.assertIn('Procesadas: 2, sin cambios: 0', out.getvalue())
+        self.assertIn('menos por descarga:', out.getvalue())
+        self.assertFalse(ImageTask.objects.filter(status='pending').exists())
+        second.refresh_from_db()
+        self.assertEqual(second.image_derivatives['width'], 2000)
+        out = io.StringIO()
+        call_command('optimize_media', '--workers', '2', stdout=out)
+        self.assertIn('Procesadas: 0, sin cambios: 2', out.getvalue())
+
+
+class MediaServingTest(TemporaryMediaMixin, StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 4
+        os.makedirs(os.path.join(self.media_root, 'product'))
+        for name in ('product/mira.jpg', 'product/mira-0123456789ab-320w.webp'):
+            with open(os.path.join(self.media_root, name), 'wb') as f:
+                f.write(self.content)
+
+    def test_full_response_and_cache_headers(self):
+        response = self.client.get('/media/product/mira.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        hashed = self.client.get('/media/product/mira-0123456789ab-320w.webp')
+        self.assertEqual(hashed['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(hashed['Content-Type'], 'image/webp')
+
+    def test_conditional_and_range_requests(self):
+        etag = self.client.get('/media/product/mira.jpg')['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        not_modified = self.client.get('/media/product/mira.jpg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        partial = self.client.get('/media/product/mira.jpg', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(partial.streaming_content), self.content[10:20])
+        suffix = self.client.get('/media/product/mira.jpg', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-4:])
+        # If-Range con otra versión: se responde el archivo completo
+        stale = self.client.get('/media/product/mira.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"viejo"')
+        self.assertEqual(stale.status_code, 200)
+        invalid = self.client.get('/media/product/mira.jpg', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(invalid.status_code, 416)
+        self.assertEqual(invalid['Content-Range'], 'bytes */1024')
+        # Rangos que no soportamos se ignoran: 200 con el archivo completo
+        for header in ('bytes=0-1,5-6', 'items=0-9', 'bytes=9-2'):
+            full = self.client.get('/media/product/mira.jpg', HTTP_RANGE=header)
+            self.assertEqual(full.status_code, 200)
+            self.assertEqual(b''.join(full.streaming_content), self.content)
+
+    def test_path_traversal_is_rejected(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/product/missing.jpg').status_code, 404)
+
+
+class ProductDetailQueriesTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        armas = Category.objects.create(name='Armas')
+        self.category = Category.objects.create(name='Pistolas', parent=armas)
+
+    def catalog_queries(self, product):
+        get_parent_categories()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product', args=[product.id]))
+        self.assertEqual(response.status_code, 200)
+        return [q for q in queries if 'store_product' in q['sql'] or 'store_category' in q['sql']], response
+
+    def test_query_budget_does_not_grow_with_gallery(self):
+        product = Product.objects.create(name='Glock 17', price=100, category=self.category)
+        small, _ = self.catalog_queries(product)
+        for i in range(5):
+            ProductImage.objects.create(product=product, image=f'uploads/product/gallery/g{i}.jpg', order=i)
+        cache.clear()
+        large, response = self.catalog_queries(product)
+        # Last-Modified, producto con categorías, galería y recomendaciones precalculadas
+        self.assertLessEqual(len(large), 4)
+        self.assertEqual(len(large), len(small))
+        self.assertContains(response, 'Armas &gt; Pistolas')
+        self.assertContains(response, 'onclick="currentSlide(', count=6)
+
+    def test_missing_product_is_404(self):
+        self.assertEqual(self.client.get(reverse('product', args=[999])).status_code, 404)
+
+
+class PrimaryImageTest(TemporaryMediaMixin, StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Visores')
+
+    def test_primary_image_follows_gallery_changes(self):
+        product = Product.objects.create(name='Bushnell', price=100, category=self.category, image='uploads/product/bushnell.jpg')
+        self.assertEqual(product.primary_image.name, 'uploads/product/bushnell.jpg')
+        extra = ProductImage.objects.create(product=product, image='uploads/product/gallery/lado.jpg')
+        primary = ProductImage.objects.create(product=product, image='uploads/product/gallery/frente.jpg', is_primary=True)
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, 'uploads/product/gallery/frente.jpg')
+        extra.is_primary = True
+        extra.save()
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, 'uploads/product/gallery/lado.jpg')
+        extra.delete()
+        primary.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, 'uploads/product/bushnell.jpg')
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_primary_image(), '/media/uploads/product/bushnell.jpg')
+
+    def test_listing_renders_without_gallery_queries(self):
+        for i in range(6):
+            product = Product.objects.create(name=f'Visor {i}', price=100, category=self.category, image=f'uploads/product/v{i}.jpg')
+            gallery = ProductImage.objects.create(product=product, image=f'uploads/product/gallery/v{i}.jpg', is_primary=True)
+            # Imagen sin derivados (anterior al pipeline): se muestra el original
+            save_derivatives(gallery, {})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertFalse([q for q in queries if 'store_productimage' in q['sql']])
+        self.assertContains(response, '/media/uploads/product/gallery/v5.jpg')
+
+    def test_gallery_primary_renders_its_own_derivatives(self):
+        product = Product.objects.create(name='Visor', price=100, category=self.category, image='uploads/product/visor.jpg')
+        gallery = ProductImage.objects.create(product=product, image='uploads/product/gallery/frente.jpg', is_primary=True)
+        save_derivatives(gallery, {
+            'source': gallery.image.name, 'hash': '0123456789ab', 'width': 640, 'height': 480, 'fallback': 'jpg',
+            'variants': {
+                'webp': [[640, 'uploads/product/gallery/frente-0123456789ab-640w.webp']],
+                'jpg': [[640, 'uploads/product/gallery/frente-0123456789ab-640w.jpg']],
+            },
+        })
+        product = Product.objects.get(pk=product.pk)
+        template = Template('{% load image_tags %}{% responsive_image product %}')
+        with self.assertNumQueries(0):
+            html = template.render(Context({'product': product}))
+        self.assertIn('frente-0123456789ab-640w.webp 640w', html)
+        self.assertIn('type="image/webp"', html)
+
+    def test_uploaded_image_is_primary_under_its_final_name(self):
+        upload = SimpleUploadedFile('visor.jpg', b'\xff\xd8\xff', content_type='image/jpeg')
+        product = Product.objects.create(name='Visor', price=100, category=self.category, image=upload)
+        product.refresh_from_db()
+        self.assertTrue(product.image.name.startswith('uploads/product/'))
+        self.assertEqual(product.primary_image.name, product.image.name)
+
+
+class RecommendationsTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Accesorios')
+        self.rifle, self.visor, self.funda, self.limpieza = [
+            Product.objects.create(name=name, price=100, category=category)
+            for name in ('Rifle', 'Visor', 'Funda', 'Kit de limpieza')
+        ]
+
+    def order(self, *products, recent=False):
+        order = PaymentOrder.objects.create(full_name='Juan', email='juan@example.com', shipping_address='Calle 1', amount_paid=0)
+        if not recent:
+            # Fuera del período de gracia de build_recommendations
+            PaymentOrder.objects.filter(pk=order.pk).update(date_ordered=timezone.now() - datetime.timedelta(hours=1))
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        return order
+
+    def test_incremental_cooccurrence_and_detail_block(self):
+        self.order(self.rifle, self.visor, self.funda)
+        self.order(self.rifle, self.visor)
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual(frequently_bought_together(self.rifle), [self.visor, self.funda])
+
+        # Solo se suman los pedidos nuevos
+        self.order(self.rifle, self.limpieza)
+        self.order(self.rifle, self.limpieza)
+        self.order(self.rifle, self.limpieza)
+        out = io.StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('Pedidos procesados: 3', out.getvalue())
+        self.assertEqual(ProductCooccurrence.objects.get(product=self.rifle, related=self.visor).count, 2)
+        self.assertEqual(frequently_bought_together(self.rifle)[0], self.limpieza)
+        out = io.StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('No hay pedidos nuevos', out.getvalue())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product', args=[self.rifle.id]))
+        self.assertEqual(len([q for q in queries if 'store_productcooccurrence' in q['sql']]), 1)
+        self.assertContains(response, 'Frecuentemente comprados juntos')
+        self.assertContains(response, 'Kit de limpieza')
+
+    def test_recent_orders_wait_for_the_next_run(self):
+        pending = self.order(self.rifle, self.funda, recent=True)
+        # Un pedido con id mayor pero ya fuera del período de gracia no adelanta el corte
+        self.order(self.rifle, self.visor)
+        self.assertIsNone(update_recommendations())
+        PaymentOrder.objects.filter(pk=pending.pk).update(date_ordered=timezone.now() - datetime.timedelta(hours=1))
+        run = update_recommendations()
+        self.assertEqual(run.orders, 2)
+        self.assertEqual(ProductCooccurrence.objects.get(product=self.rifle, related=self.funda).count, 1)
+
+
+class EffectivePriceTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Ópticas')
+        self.visor = Product.objects.create(name='Visor', price=250000, is_sale=True, sale_price=150000, category=self.category)
+        self.mira = Product.objects.create(name='Mira', price=40000, category=self.category)
+
+    def test_annotation_matches_instance_rule(self):
+        products = Product.objects.with_effective_price().order_by('id')
+        self.assertEqual([p.get_effective_price() for p in products], [150000, 40000])
+        self.assertEqual([effective_price(p) for p in Product.objects.order_by('id')], [150000, 40000])
+
+    def test_cart_total_uses_the_same_rule(self):
+        with self.assertNumQueries(1):
+            snapshot = CartSnapshot({str(self.visor.id): 2, str(self.mira.id): 1})
+        self.assertEqual(snapshot.total, 340000)
+        self.assertEqual(CartSnapshot({}).total, 0)
+
+    def test_price_facet_uses_sale_price(self):
+        response = self.client.get(reverse('category', args=['opticas']), {'price': '50000-200000'})
+        self.assertEqual([p.name for p in response.context['products']], ['Visor'])
+        self.assertEqual([o['count'] for o in response.context['facets']['price']], [1, 1, 0, 0])
+
+    def test_price_filter_can_use_the_price_indexes(self):
+        queryset = apply_filters(Product.objects.filter(category=self.category), {'price': '50000-200000'})
+        self.assertEqual([p.name for p in queryset], ['Visor'])
+        self.assertNotIn('CASE', str(queryset.query))
+        plan = queryset.explain()
+        self.assertIn('product_category_price_idx', plan)
+        self.assertIn('product_category_sale_idx', plan)
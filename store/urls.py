@@ -17,8 +17,10 @@ urlpatterns = [
     path('category/<str:parent_slug>/<str:subcategory_slug>/', views.subcategory, name='subcategory'),
     path('category_summary/', views.category_summary, name='category_summary'),
     path('api/categories/', views.categories_ajax, name='categories_ajax'),
+    path('api/products/', views.products_ajax, name='products_ajax'),
     path('admin/visit-stats/', views.visit_stats, name='visit_stats'),
     path('search/', views.search, name='search'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
     path('webhook/mercadopago/', views.mercadopago_webhook, name='mercadopago_webhook'),
     path('test-navbar/', views.test_navbar, name='test_navbar'),  # Vista temporal para debug
 ]
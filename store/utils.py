@@ -0,0 +1,16 @@
+"""
+Utilidades de texto compartidas por las vistas, la búsqueda y los comandos
+"""
+import unicodedata
+
+
+def normalize_text(text):
+    """
+    Normaliza texto para búsquedas más robustas
+    Elimina acentos y caracteres especiales para comparación
+    """
+    # Normalizar unicode (NFD = Forma Normalizada Descompuesta)
+    normalized = unicodedata.normalize('NFD', text)
+    # Remover marcas diacríticas (acentos)
+    without_accents = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
+    return without_accents.lower().strip()
@@ -1,4 +1,4 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from .models import Product, Category, Profile, Order
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
@@ -12,34 +12,55 @@ from payment.models import ShippingAddress
 from django import forms
 from django.db.models import Q
 import json
-from cart.cart import Cart
+from cart.cart import get_cart
 from django.http import HttpResponseRedirect
 import mercadopago
 from django.conf import settings
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.core.mail import send_mail
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.http import condition
 from django.contrib.auth.decorators import user_passes_test
 from django.db.models import Count
 from datetime import datetime, timedelta
 from django.core.paginator import Paginator
-import unicodedata
+from django.utils.text import slugify
+from .utils import normalize_text
+from .search import search_products
+from .autocomplete import suggest
+from .pagination import keyset_paginate, serialize_product
+from .facets import apply_filters, build_facets
+from .categories import tree_etag, tree_json, tree_last_modified
+from .recommendations import frequently_bought_together
+from .page_cache import (
+	anonymous_page_cache, catalog_etag,
+	product_last_modified, category_last_modified, subcategory_last_modified,
+)
 
 def search(request):
-    query = request.GET.get('q', '').strip()
+    # El navbar busca por GET (q) y el formulario de la página por POST (searched)
+    query = (request.GET.get('q') or request.POST.get('searched') or '').strip()
     # Redirigir si la búsqueda coincide exactamente con una categoría (ignorando mayúsculas y espacios)
-    category = Category.objects.filter(name__iexact=query).first()
+    category = Category.objects.filter(name__iexact=query).first() if query else None
     if category:
         # Normalizar el nombre para la URL
         url_name = category.name.replace(' ', '-')
         return redirect(f'/category/{url_name}')
-    products = Product.objects.filter(name__icontains=query)
+    # Resultados ordenados por relevancia desde el índice full-text
+    products = search_products(query)
     context = {
         'query': query,
         'products': products,
+        'search_term': query,
+        'searched': products,
     }
     return render(request, 'search.html', context)
 
+def autocomplete(request):
+    """Sugerencias del buscador mientras se escribe (sin consultas a la base)"""
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'query': query, 'suggestions': suggest(query)})
+
 def update_info(request):
 	if request.user.is_authenticated:
 		# Get Current User
@@ -109,22 +130,30 @@ def category_summary(request):
 	categories = Category.objects.filter(parent=None)  # Solo categorías principales
 	return render(request, 'category_summary.html', {"categories":categories})	
 
+@condition(etag_func=catalog_etag, last_modified_func=category_last_modified)
+@anonymous_page_cache
 def category(request, foo):
-	# Replace Hyphens with Spaces
-	foo = foo.replace('-', ' ')
-	
-	# Grab the category from the url usando búsqueda robusta
+	# Grab the category from the url: un único lookup por el slug indexado
 	try:
-		# Look Up The Category usando la nueva función
-		category = find_category_by_name(foo, parent=None)
+		category = Category.objects.filter(parent=None, slug=slugify(foo)).first()
 		if not category:
-			messages.error(request, f"La categoría '{foo}' no existe.")
+			# URLs viejas o con nombres aproximados: redirigir a la URL canónica
+			legacy = find_category_by_name(foo.replace('-', ' '), parent=None)
+			if legacy:
+				return redirect(legacy.get_absolute_url(), permanent=True)
+			messages.error(request, f"La categoría '{foo.replace('-', ' ')}' no existe.")
 			return redirect('home')
 		
-		products = category.get_all_products()  # Usar el nuevo método
+		all_products = category.get_all_products()
 		
 		# Obtener subcategorías si es una categoría principal
-		subcategories = category.subcategories.filter(is_active=True) if category.is_parent else None
+		subcategories = list(category.subcategories.filter(is_active=True)) if category.is_parent else []
+		
+		# Facetas (conteos cacheados) y página actual de los productos filtrados
+		facets = build_facets(category, all_products, request.GET, subcategories)
+		for sub, option in zip(subcategories, facets['subcategories']):
+			sub.product_count = option['count']
+		products = keyset_paginate(request, apply_filters(all_products, request.GET, subcategories))
 		
 		# Verificar si es la categoría "Armas" que requiere verificación de edad
 		category_name_lower = normalize_text(category.name)
@@ -132,45 +161,64 @@ def category(request, foo):
 		if category_name_lower in ['armas', 'arma', 'firearms', 'weapons']:
 			return render(request, 'age_verification.html', {
 				'products': products, 
+				'page': products,
+				'facets': facets,
 				'category': category,
 				'subcategories': subcategories
 			})
 		
 		return render(request, 'category.html', {
 			'products': products, 
+			'page': products,
+			'facets': facets,
 			'category': category,
 			'subcategories': subcategories
 		})
 	except Exception as e:
-		messages.error(request, f"La categoría '{foo}' no existe.")
+		messages.error(request, f"La categoría '{foo.replace('-', ' ')}' no existe.")
 		return redirect('home')
 
+@condition(etag_func=catalog_etag, last_modified_func=subcategory_last_modified)
+@anonymous_page_cache
 def subcategory(request, parent_slug, subcategory_slug):
-	"""Vista para subcategorías específicas con búsqueda robusta"""
+	"""Vista para subcategorías específicas, resueltas por slug"""
 	parent_name = parent_slug.replace('-', ' ')
 	subcategory_name = subcategory_slug.replace('-', ' ')
 	
 	try:
-		# Usar la nueva función de búsqueda robusta
-		parent_category = find_category_by_name(parent_name, parent=None)
-		if not parent_category:
-			messages.error(request, f"La categoría '{parent_name}' no existe.")
-			return redirect('home')
-		
-		subcategory = find_category_by_name(subcategory_name, parent=parent_category)
+		# Un solo lookup indexado por los dos slugs
+		subcategory = Category.objects.select_related('parent').filter(
+			slug=slugify(subcategory_slug),
+			parent__slug=slugify(parent_slug),
+			parent__parent=None,
+		).first()
 		if not subcategory:
-			messages.error(request, f"La subcategoría '{subcategory_name}' no existe en '{parent_category.name}'.")
-			return redirect('category', foo=parent_slug)
+			# URLs viejas: búsqueda aproximada por nombre y redirección a la canónica
+			parent_category = find_category_by_name(parent_name, parent=None)
+			if not parent_category:
+				messages.error(request, f"La categoría '{parent_name}' no existe.")
+				return redirect('home')
+			legacy = find_category_by_name(subcategory_name, parent=parent_category)
+			if not legacy:
+				messages.error(request, f"La subcategoría '{subcategory_name}' no existe en '{parent_category.name}'.")
+				return redirect(parent_category.get_absolute_url())
+			return redirect(legacy.get_absolute_url(), permanent=True)
+		parent_category = subcategory.parent
 		
-		products = Product.objects.filter(category=subcategory)
+		all_products = Product.objects.filter(category=subcategory)
+		facets = build_facets(subcategory, all_products, request.GET)
+		products = keyset_paginate(request, apply_filters(all_products, request.GET))
 		
 		# Agregar información adicional para el template
+		product_count = facets['total']
 		context = {
 			'products': products,
+			'page': products,
+			'facets': facets,
 			'subcategory': subcategory,
 			'parent_category': parent_category,
-			'product_count': products.count(),
-			'has_products': products.exists()
+			'product_count': product_count,
+			'has_products': product_count > 0
 		}
 		
 		return render(request, 'subcategory.html', context)
@@ -178,37 +226,49 @@ def subcategory(request, parent_slug, subcategory_slug):
 		messages.error(request, f"Error al acceder a la subcategoría: {str(e)}")
 		return redirect('home')
 
+@condition(etag_func=tree_etag, last_modified_func=tree_last_modified)
 def categories_ajax(request):
-	"""Vista AJAX para obtener categorías en formato JSON"""
-	categories_data = []
-	for category in Category.objects.filter(parent=None, is_active=True):
-		subcategories = []
-		for sub in category.subcategories.filter(is_active=True):
-			subcategories.append({
-				'id': sub.id,
-				'name': sub.name,
-				'product_count': Product.objects.filter(category=sub).count()
-			})
-		
-		categories_data.append({
-			'id': category.id,
-			'name': category.name,
-			'product_count': category.get_all_products().count(),
-			'subcategories': subcategories
-		})
-	
-	return JsonResponse({'categories': categories_data})
+	"""Vista AJAX para obtener categorías en formato JSON (cacheado, con ETag)"""
+	return HttpResponse(tree_json(), content_type='application/json')
 
+# La cookie CSRF se pone en cada respuesta: el HTML cacheado no lleva el token
+@ensure_csrf_cookie
+@condition(etag_func=catalog_etag, last_modified_func=product_last_modified)
+@anonymous_page_cache
 def product(request,pk):
-	product = Product.objects.get(id=pk)
-	return render(request, 'product.html', {'product':product})
+	# Una consulta para el producto con su categoría (y la padre, que usa __str__) y otra para toda la galería
+	product = get_object_or_404(
+		Product.objects.select_related('category__parent').prefetch_related('additional_images'),
+		id=pk,
+	)
+	# Precalculadas por build_recommendations: una consulta por índice
+	related = frequently_bought_together(product)
+	return render(request, 'product.html', {'product':product, 'related':related})
 
 
+@anonymous_page_cache
 def home(request):
-	products = Product.objects.all()
-	return render(request, 'home.html', {'products':products})
+	products = keyset_paginate(request, Product.objects.all())
+	return render(request, 'home.html', {'products':products, 'page':products})
 
 
+def products_ajax(request):
+	"""Variante JSON de "cargar más": /api/products/?category=<id>&after=<cursor>"""
+	products = Product.objects.all()
+	category_id = request.GET.get('category')
+	if category_id:
+		category = Category.objects.filter(id=category_id).first() if category_id.isdigit() else None
+		if category is None:
+			return JsonResponse({'error': 'Categoría inexistente'}, status=404)
+		products = category.get_all_products()
+	page = keyset_paginate(request, products)
+	return JsonResponse({
+		'products': [serialize_product(product) for product in page],
+		'next_cursor': page.next_cursor,
+	})
+
+
+@anonymous_page_cache
 def about(request):
 	return render(request, 'about.html', {})	
 
@@ -251,22 +311,8 @@ def login_user(request):
 			except Profile.DoesNotExist:
 				current_user = Profile.objects.create(user=request.user)
 			
-			# Get their saved cart from database
-			saved_cart = current_user.old_cart
-			# Convert database string to python dictionary
-			if saved_cart:
-				try:
-					# Convert to dictionary using JSON
-					converted_cart = json.loads(saved_cart)
-					# Add the loaded cart dictionary to our session
-					# Get the cart
-					cart = Cart(request)
-					# Loop thru the cart and add the items from the database
-					for key,value in converted_cart.items():
-						cart.db_add(product=key, quantity=value)
-				except json.JSONDecodeError:
-					# Si hay error en el JSON, continuar sin carrito guardado
-					pass
+			# Get their saved cart from database (una sola lectura de CartLine)
+			get_cart(request).restore_saved()
 
 			messages.success(request, f"¡Bienvenido {authenticated_user.username}! Has iniciado sesión correctamente.")
 			return redirect('home')
@@ -309,7 +355,7 @@ def pagar_producto(request, pk):
     product = Product.objects.get(id=pk)
     sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
     # Si el precio es 0, no permitir pagar
-    precio = float(product.sale_price if product.is_sale else product.price)
+    precio = float(product.get_effective_price())
     if precio <= 0:
         from django.contrib import messages
         messages.error(request, "El precio del producto debe ser mayor a 0 para poder pagar.")
@@ -401,7 +447,7 @@ def mercadopago_webhook(request):
                 for orden in ordenes:
                     prod = orden.product
                     cantidad = orden.quantity
-                    precio_unit = prod.sale_price if prod.is_sale else prod.price
+                    precio_unit = prod.get_effective_price()
                     subtotal = precio_unit * cantidad
                     total += subtotal
                     detalle_items += f"{cantidad} x {prod.name} por ${precio_unit} cada uno.\n"
@@ -506,21 +552,11 @@ def test_navbar(request):
     return render(request, 'test_navbar.html')
 
 
-def normalize_text(text):
-    """
-    Normaliza texto para búsquedas más robustas
-    Elimina acentos y caracteres especiales para comparación
-    """
-    # Normalizar unicode (NFD = Forma Normalizada Descompuesta)
-    normalized = unicodedata.normalize('NFD', text)
-    # Remover marcas diacríticas (acentos)
-    without_accents = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
-    return without_accents.lower().strip()
-
 def find_category_by_name(name, parent=None):
     """
     Encuentra una categoría por nombre de forma más robusta
     Maneja acentos y diferencias de capitalización
+    Las vistas resuelven por slug; esto queda solo para redirigir URLs viejas
     """
     # Normalizar el nombre a buscar
     normalized_search = normalize_text(name)